@@ -0,0 +1,294 @@
+# Benchmarks of the callbacks of all tabs. The callbacks are imported from the tabs and from visualization_app.py and are
+# driven with synthetic interaction traces: dragging the age slider, streams of hover events, selecting 50+ players,
+# finding similar players and switching tabs. For every callback the p50/p95/p99 latency is reported, as well as the
+# peak and retained memory (measured with tracemalloc in a separate pass, as tracing slows the callbacks down), and the
+# size of the response: the json dash sends for the output of the callback, and that json compressed with gzip.
+#
+# The player tables are replaced by synthetic tables scaled to a number of times their size, to see how every callback
+# scales with the size of the data:
+#   python benchmark.py --scales 1 10 100 --output results.json
+#   python benchmark.py --scales 1 10 100 --compare results.json
+#
+# With --ingest the loading of a table is measured instead: the peak memory and time of streaming a scaled csv file into
+# the table cache in parts of --chunk-rows rows (see ingest.py), next to reading the whole file at once:
+#   python benchmark.py --ingest --scales 10 100 --chunk-rows 10000 50000
+
+import argparse
+import gzip
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+from plotly.io.json import to_json_plotly
+
+from viz_app.main import dataframes, figure_cache
+from viz_app.config import player_tables
+from viz_app.data import prepare_player_table
+from viz_app.synthetic import synthetic_tables, base_table, scale_table
+from viz_app import cache
+from viz_app.data import _read_csv
+from viz_app.ingest import ingest_csv
+from viz_app.tabs import explore, search, compare
+import visualization_app
+
+
+# Dash 2.x wraps the decorated callbacks, later versions return the function itself
+def unwrap(func):
+    return getattr(func, '__wrapped__', func)
+
+
+def install_tables(factor, seed):
+    dataframes.memory_budget = None
+    for table, df in synthetic_tables(factor, seed).items():
+        df.attrs['source_version'] = f'synthetic-{factor}-{seed}'
+        dataframes.install(table, prepare_player_table(table, df))
+
+
+# The interaction traces, every trace is a list of (callback name, function, arguments)
+def build_traces(stat, players, steps):
+    table = dataframes.table(stat)
+    features = table.schema.radar_features
+    rng = np.random.default_rng(0)
+    traces = {}
+
+    # dragging both handles of the age slider, with a changing position filter
+    position_filters = [None, ['DF'], ['MF', 'FW'], ['GK', 'DF', 'MF', 'FW']]
+    slider = []
+    for step in range(steps):
+        low = 15 + step % 12
+        high = 40 - step % 9
+        positions = position_filters[step % len(position_filters)]
+        slider.append(('explore.update_explore_dropdown_and_chart', explore.update_explore_dropdown_and_chart,
+                       (stat, features[step % len(features)], [low, high], positions, 'desc')))
+        slider.append(('explore.update_position_counts', explore.update_position_counts, (stat, [low, high])))
+    traces['slider_drag'] = slider
+
+    # hovering over the players of the leaderboard, one event per player. The radar chart of the explore tab is drawn
+    # in the browser, so this trace is only measured when the server side hover callback exists
+    hover = []
+    if hasattr(explore, 'update_explore_radar_chart'):
+        for step in range(steps):
+            point = {'points': [{'customdata': [players[step % len(players)]]}]}
+            hover.append(('explore.update_explore_radar_chart', explore.update_explore_radar_chart, (point, stat)))
+    traces['hover_stream'] = hover
+
+    # growing a selection of players up to 60 players, as scouts do in the search and compare tabs
+    selection = []
+    teams = list(table.facets.values('team'))[:4]
+    selected_features = features[:6]
+    for size in range(5, 65, 5):
+        chosen = [players[i] for i in rng.choice(len(players), size=min(size, len(players)), replace=False)]
+        selection.append(('search.update_feature_and_team_dropdown', search.update_feature_and_team_dropdown, (stat,)))
+        selection.append(('search.update_player_dropdown', search.update_player_dropdown, (teams, stat)))
+        for name in ('update_bar_chart', 'update_radar_chart', 'update_search_charts'):
+            if hasattr(search, name):
+                selection.append((f'search.{name}', getattr(search, name), (stat, selected_features, chosen)))
+        for name in ('update_compare_radar_chart',):
+            if hasattr(compare, name):
+                selection.append((f'compare.{name}', getattr(compare, name), (chosen, stat, selected_features)))
+        for name in ('update_compare_feature_dropdown_and_chart', 'update_compare_charts'):
+            if hasattr(compare, name):
+                selection.append((f'compare.{name}', getattr(compare, name), (stat, selected_features, chosen)))
+        selection.append(('compare.update_compare_stat_and_feature_dropdown',
+                          compare.update_compare_stat_and_feature_dropdown, (stat,)))
+        selection.append(('app.update_selection', visualization_app.update_selection, (chosen,)))
+        selection.append(('app.remove_from_selection', visualization_app.remove_from_selection,
+                          ([0] * (len(chosen) - 1) + [1], chosen)))
+    traces['multi_select'] = selection
+
+    # finding players like one selected player (and now and then like a whole selection) over changing features
+    similar = []
+    if hasattr(search, 'add_similar_players'):
+        for step in range(steps):
+            query = players[step % len(players)::max(1, len(players) // 20)] if step % 10 == 0 else [
+                players[step % len(players)]]
+            chosen_features = [features[(step + i) % len(features)] for i in range(1 + step % 6)]
+            metric = 'cosine' if step % 2 else 'euclidean'
+            similar.append(('search.add_similar_players', search.add_similar_players,
+                            (step, stat, chosen_features, query, [], 5, metric, [])))
+    traces['similar_search'] = similar
+
+    # switching between the tabs
+    traces['tab_switch'] = [('app.change_tab', visualization_app.change_tab, (tab,))
+                            for tab in ['tab-explore', 'tab-search', 'tab-compare'] * max(1, steps // 3)]
+    return traces
+
+
+def percentile(values, p):
+    return float(np.percentile(values, p)) if values else 0.0
+
+
+# runs every call of the traces, first timed and then again while tracing the memory allocations
+def run_traces(traces):
+    timings = {}
+    memory = {}
+    calls = [call for trace in traces.values() for call in trace]
+
+    # warm up, so lazy imports and the first table access are not part of the measurements
+    for name, func, args in calls:
+        unwrap(func)(*args)
+
+    # the total time of every trace is kept as well, it shows the server work per interaction even when callbacks are
+    # merged or split
+    totals = {}
+    for trace, trace_calls in traces.items():
+        for name, func, args in trace_calls:
+            start = time.perf_counter()
+            unwrap(func)(*args)
+            elapsed = (time.perf_counter() - start) * 1000
+            timings.setdefault(name, []).append(elapsed)
+            totals[trace] = totals.get(trace, 0.0) + elapsed
+
+    tracemalloc.start()
+    payloads = {}
+    for name, func, args in calls:
+        tracemalloc.reset_peak()
+        before, _ = tracemalloc.get_traced_memory()
+        result = unwrap(func)(*args)
+        after, peak = tracemalloc.get_traced_memory()
+        memory.setdefault(name, []).append((peak - before, after - before))
+        payloads.setdefault(name, []).append(result)
+        del result
+    tracemalloc.stop()
+
+    # the size of the output of every call as dash serializes it, and compressed the way the server compresses it
+    sizes = {}
+    for name, outputs in payloads.items():
+        for output in outputs:
+            text = to_json_plotly(output).encode('utf-8')
+            sizes.setdefault(name, []).append((len(text), len(gzip.compress(text, compresslevel=6))))
+
+    results = {}
+    for name, values in timings.items():
+        results[name] = {
+            'calls': len(values),
+            'mean_ms': statistics.fmean(values),
+            'p50_ms': percentile(values, 50),
+            'p95_ms': percentile(values, 95),
+            'p99_ms': percentile(values, 99),
+            'peak_kib': max(peak for peak, _ in memory[name]) / 1024,
+            'allocated_kib': statistics.fmean(peak for peak, _ in memory[name]) / 1024,
+            'retained_kib': statistics.fmean(retained for _, retained in memory[name]) / 1024,
+            'payload_kib': statistics.fmean(size for size, _ in sizes[name]) / 1024,
+            'payload_gzip_kib': statistics.fmean(size for _, size in sizes[name]) / 1024,
+        }
+    return results, totals
+
+
+def print_results(scale, rows, results, totals, baseline=None):
+    print(f'\nscale {scale}x ({rows} rows per table)')
+    print(f'{"callback":55} {"calls":>6} {"p50 ms":>9} {"p95 ms":>9} {"p99 ms":>9} {"peak KiB":>10} {"json KiB":>9} '
+          f'{"gzip KiB":>9}'
+          + (f' {"p50 vs baseline":>16}' if baseline else ''))
+    for name, result in sorted(results.items()):
+        line = (f'{name:55} {result["calls"]:6d} {result["p50_ms"]:9.3f} {result["p95_ms"]:9.3f} '
+                f'{result["p99_ms"]:9.3f} {result["peak_kib"]:10.1f} {result["payload_kib"]:9.1f} '
+                f'{result["payload_gzip_kib"]:9.1f}')
+        if baseline:
+            old = baseline.get(str(scale), {}).get('results', {}).get(name)
+            line += f' {result["p50_ms"] / old["p50_ms"]:15.2f}x' if old and old['p50_ms'] else f' {"-":>16}'
+        print(line)
+    for trace, total in sorted(totals.items()):
+        line = f'trace {trace:49} total {total:9.3f} ms'
+        if baseline:
+            old = baseline.get(str(scale), {}).get('traces', {}).get(trace)
+            line += f' ({total / old:.2f}x baseline)' if old else ''
+        print(line)
+
+
+# the time and traced peak memory of a function call
+def measure(func):
+    tracemalloc.start()
+    start = time.perf_counter()
+    func()
+    seconds = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {'seconds': seconds, 'peak_mib': peak / 1024 / 1024}
+
+
+# Measures loading a scaled csv file of the table: a whole read against streaming it into the table cache
+def benchmark_ingest(stat, scales, chunk_rows, seed):
+    results = {}
+    with tempfile.TemporaryDirectory() as folder:
+        cache.cache_path = os.path.join(folder, 'cache')
+        for scale in scales:
+            path = os.path.join(folder, f'{stat}-{scale}.csv')
+            scale_table(base_table(stat, seed), scale, seed).to_csv(path, index=False)
+            rows = sum(1 for _ in open(path)) - 1
+            size = os.path.getsize(path) / 1024 / 1024
+
+            runs = {'whole': measure(lambda: _read_csv(path))}
+            for chunk in chunk_rows:
+                runs[f'chunks of {chunk}'] = measure(
+                    lambda: ingest_csv(f'benchmark/{stat}', path, {'sha1': 'benchmark'}, chunk))
+            results[str(scale)] = {'rows': rows, 'file_mib': size, 'runs': runs}
+
+            print(f'\nscale {scale}x ({rows} rows, {size:.1f} MiB csv)')
+            for name, run in runs.items():
+                print(f'{name:30} {run["seconds"]:8.2f} s {run["peak_mib"]:10.1f} MiB peak')
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the callbacks of the visualization app')
+    parser.add_argument('--scales', type=int, nargs='+', default=[1, 10, 100],
+                        help='the factors the player tables are scaled by (e.g. 1 10 100 1000)')
+    parser.add_argument('--stat', default=player_tables[0], help='the player table the traces use')
+    parser.add_argument('--steps', type=int, default=60, help='the number of events in the slider and hover traces')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--figure-cache', action='store_true',
+                        help='keep the figure cache enabled, by default every figure is built')
+    parser.add_argument('--ingest', action='store_true', help='benchmark loading the csv files instead of the callbacks')
+    parser.add_argument('--chunk-rows', type=int, nargs='+', default=[10000, 50000],
+                        help='the part sizes of the streaming ingestion measured with --ingest')
+    parser.add_argument('--output', help='write the results as json to this file')
+    parser.add_argument('--compare', help='a json file of an earlier run to compare the results with')
+    args = parser.parse_args()
+
+    if args.ingest:
+        results = benchmark_ingest(args.stat, args.scales, args.chunk_rows, args.seed)
+        if args.output:
+            with open(args.output, 'w') as f:
+                json.dump({'ingest': results}, f, indent=2)
+        return
+
+    if not args.figure_cache:
+        figure_cache.max_entries = 0
+        figure_cache.directory = None
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)['scales']
+
+    output = {
+        'meta': {'python': platform.python_version(), 'pandas': pd.__version__, 'numpy': np.__version__,
+                 'time': time.time(), 'stat': args.stat, 'steps': args.steps, 'figure_cache': args.figure_cache},
+        'scales': {},
+    }
+    for scale in args.scales:
+        install_tables(scale, args.seed)
+        table = dataframes.table(args.stat)
+        figure = unwrap(explore.update_explore_dropdown_and_chart)(args.stat, None, [15, 40], None, 'desc')[0]
+        players = list(figure['data'][0]['x']) if figure['data'] else []
+        # the hover and selection traces need more players than the leaderboard holds
+        players = list(dict.fromkeys(players + table.frame['player'].iloc[:100].tolist()))
+        results, totals = run_traces(build_traces(args.stat, players, args.steps))
+        output['scales'][str(scale)] = {'rows': len(table.frame), 'results': results, 'traces': totals}
+        print_results(scale, len(table.frame), results, totals, baseline)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(output, f, indent=2)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
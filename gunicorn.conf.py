@@ -0,0 +1,31 @@
+# Settings for running the app with gunicorn, with several worker processes on one host:
+#   gunicorn -c gunicorn.conf.py visualization_app:server
+# Before the workers start, the master process builds the table cache of every table once (the columns as well as the
+# ranking indexes, see materialize_tables in data.py). The workers then memory map those files instead of parsing and
+# sorting the tables themselves, so they share one copy of the data through the page cache and only hold a small
+# private part each (the player names and the lookup dictionaries). The master then precomputes the common leaderboards
+# of the explore tab once into the disk tier of the figure cache (see precompute.py), which all workers read.
+import multiprocessing
+
+bind = '0.0.0.0:8050'
+workers = multiprocessing.cpu_count()
+
+# the app is imported by every worker rather than by the master, only the table files are shared
+preload_app = False
+
+
+def on_starting(server):
+    from viz_app.config import player_tables, use_table_cache, combined_table, figure_cache_path, precompute_workers
+    from viz_app.data import materialize_tables, team_tables
+    from viz_app.precompute import LeaderboardPrecompute
+
+    if use_table_cache:
+        server.log.info('materializing the table cache')
+        materialize_tables(player_tables, team_tables(), combined_table)
+
+    # without a shared figure cache the leaderboards would only be built for the master, so they are left to the workers
+    leaderboards = LeaderboardPrecompute(player_tables, figure_cache_path, precompute_workers)
+    if leaderboards.enabled:
+        server.log.info('precomputing the leaderboards')
+        leaderboards.run()
+        server.log.info('precomputed the leaderboards: %s', leaderboards.report())
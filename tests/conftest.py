@@ -0,0 +1,31 @@
+# The tests run the callbacks on generated player tables (see synthetic.py) installed in the registry, so they need
+# neither the data folder nor a running server. The tables are always generated from a fixed seed, also where the real
+# data is available, so the saved outputs of the callbacks (see test_figures.py) hold everywhere. The figure cache is
+# switched off, so every call builds its figures.
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def install_tables():
+    from viz_app.main import dataframes, figure_cache
+    from viz_app.config import player_tables
+    from viz_app.data import prepare_player_table
+    from viz_app.synthetic import generate_table
+
+    figure_cache.max_entries = 0
+    figure_cache.directory = None
+    for table in player_tables:
+        df = generate_table(table, seed=0)
+        df.attrs['source_version'] = 'synthetic-test'
+        dataframes.install(table, prepare_player_table(table, df))
+    return dataframes
+
+
+@pytest.fixture(scope='session')
+def tables():
+    return install_tables()
@@ -0,0 +1,56 @@
+# Before a background call is forked, the worker loads the table the request selects (see install_table_loading in
+# background.py). Only that table is loaded, and a table that cannot be loaded does not fail the request.
+
+from dash import Dash, Input, Output, html
+
+from viz_app.background import install_table_loading
+
+
+class Registry:
+
+    def __init__(self, names, broken=()):
+        self.names = names
+        self.broken = broken
+        self.loaded = []
+
+    def __contains__(self, name):
+        return name in self.names
+
+    def table(self, name):
+        if name in self.broken:
+            raise OSError(f'{name} is missing')
+        self.loaded.append(name)
+
+
+def app_with(registry):
+    app = Dash(__name__)
+    app.layout = html.Div([html.Div(id='stats-dropdown'), html.Div(id='out')])
+
+    @app.callback(Output('out', 'children'), Input('stats-dropdown', 'children'))
+    def show(value):
+        return value
+
+    return install_table_loading(app, registry)
+
+
+def post(app, value):
+    body = {'output': 'out.children', 'outputs': {'id': 'out', 'property': 'children'},
+            'inputs': [{'id': 'stats-dropdown', 'property': 'value', 'value': value}], 'changedPropIds': []}
+    return app.server.test_client().post('/_dash-update-component', json=body)
+
+
+def test_only_the_selected_table_is_loaded():
+    registry = Registry(['player_defense', 'player_gca'])
+    app = app_with(registry)
+    app.server.test_client().get('/')
+    assert registry.loaded == []
+    post(app, 'player_gca')
+    assert registry.loaded == ['player_gca']
+
+
+def test_a_table_that_cannot_be_loaded_is_left_to_the_callback():
+    registry = Registry(['player_defense', 'player_combined'], broken=['player_combined'])
+    app = app_with(registry)
+    assert post(app, 'player_combined').status_code == 200
+    post(app, 'player_defense')
+    assert registry.loaded == ['player_defense']
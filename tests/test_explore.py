@@ -0,0 +1,47 @@
+# Edge cases of the leaderboard of the explore tab, on small tables installed next to the generated ones
+
+import pandas as pd
+
+from viz_app import figures
+
+
+def unwrap(func):
+    return getattr(func, '__wrapped__', func)
+
+
+# a table without any feature that can be ranked gets an empty chart
+def test_a_table_without_rankable_features_gets_an_empty_leaderboard(tables):
+    from viz_app.data import normalize_table, prepare_player_table
+    from viz_app.tabs import explore
+
+    df = normalize_table(pd.DataFrame({'player': ['Player 1', 'Player 2'], 'position': ['DF', 'MF'],
+                                       'team': ['Spain', 'Wales'], 'club': ['Club 1', 'Club 2']}))
+    df.attrs['source_version'] = 'text-only'
+    tables.install('player_text', prepare_player_table('player_text', df))
+
+    fig, options, radar_data = unwrap(explore.update_explore_dropdown_and_chart)('player_text', None, [15, 40], None)
+    assert fig == figures.empty_figure()
+    features = tables.table('player_text').schema.display_features
+    assert options == [{'label': feature, 'value': feature} for feature in features]
+    assert radar_data is None
+
+
+# the radar values sent along with the leaderboard are in the order of its bars, so two players with the same name each
+# keep their own values
+def test_the_radar_data_follows_the_leaderboard_when_names_repeat(tables):
+    from viz_app.data import normalize_table, prepare_player_table
+    from viz_app.tabs import explore
+
+    df = normalize_table(pd.DataFrame({'player': ['Ann', 'Ann', 'Bea'], 'position': ['DF', 'MF', 'FW'],
+                                       'team': ['Spain', 'Wales', 'Wales'], 'club': ['Club 1', 'Club 2', 'Club 3'],
+                                       'age': ['25-100', '30-001', '21-200'], 'goals': [3, 9, 5],
+                                       'shots': [10, 20, 30]}))
+    df.attrs['source_version'] = 'repeated-names'
+    tables.install('player_repeated', prepare_player_table('player_repeated', df))
+
+    fig, _, radar_data = unwrap(explore.update_explore_dropdown_and_chart)('player_repeated', 'goals', [15, 40], None)
+    assert fig['data'][0]['x'] == ['Ann', 'Bea', 'Ann']
+    assert fig['data'][0]['customdata'] == [['Ann', 0], ['Bea', 1], ['Ann', 2]]
+    goals = radar_data['features'].index('goals')
+    values = [(row['player'], row['values'][goals]) for row in radar_data['players']]
+    assert values == [('Ann', 9), ('Bea', 5), ('Ann', 3)]
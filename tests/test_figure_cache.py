@@ -0,0 +1,23 @@
+# The disk tier of the figure cache is pruned least recently used first: a figure read from disk counts as used, even
+# when it was written long before the others (like the precomputed leaderboards, see precompute.py).
+
+import os
+
+from viz_app.figure_cache import FigureCache, figure_key
+
+
+def test_pruning_keeps_the_figures_read_from_disk(tmp_path):
+    writer = FigureCache(directory=str(tmp_path))
+    keys = [figure_key('explore-bar', 'v1', [i]) for i in range(4)]
+    for i, key in enumerate(keys):
+        writer.put(key, {'data': [{'type': 'bar', 'y': [i] * 100}], 'layout': {}})
+        # the figures were written one after the other, the first one is the oldest
+        os.utime(writer._path(key), (1000 + i, 1000 + i))
+
+    reader = FigureCache(max_entries=0, directory=str(tmp_path))
+    assert reader.get(keys[0]) is not None
+
+    size = os.path.getsize(writer._path(keys[0]))
+    writer.max_disk_bytes = 2 * size
+    writer._prune_disk()
+    assert [os.path.exists(writer._path(key)) for key in keys] == [True, False, False, True]
@@ -0,0 +1,108 @@
+# Golden test of the tab callbacks. Every callback that builds a figure is run with typical inputs on the generated
+# tables (see conftest.py), and its whole output (figures, dropdown options, stores) has to be the same as the output
+# saved in golden/figures.json: titles, feature lists, colours and the assembly of the leaderboards included. The
+# figures are compacted without typed arrays, so the output does not depend on the installed plotly.js. The default
+# plotly template is saved once; the template of a figure is saved as the trace types it keeps of it (see payload.py).
+# After an intended change of the output, write the saved outputs again with: python tests/test_figures.py
+
+import json
+import os
+import sys
+
+import pytest
+from plotly.utils import PlotlyJSONEncoder
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from viz_app import figures, payload
+
+GOLDEN_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'golden', 'figures.json')
+
+STAT = 'player_defense'
+PLAYERS = ['Player 3', 'Player 17', 'Player 42', 'Player 108', 'Player 512']
+
+
+def callback_calls(tables):
+    from viz_app.tabs import explore, search, compare
+
+    features = tables.table(STAT).schema.radar_features
+    gca_features = tables.table('player_gca').schema.radar_features
+    return {
+        'explore-leaderboard': (explore.update_explore_dropdown_and_chart,
+                                (STAT, features[0], [18, 30], ['DF', 'MF'], 'desc')),
+        'explore-leaderboard-ascending': (explore.update_explore_dropdown_and_chart,
+                                          (STAT, features[1], [15, 40], None, 'asc')),
+        'explore-leaderboard-other-table': (explore.update_explore_dropdown_and_chart,
+                                            ('player_gca', None, [15, 40], ['FW'], 'desc')),
+        'explore-leaderboard-empty': (explore.update_explore_dropdown_and_chart,
+                                      (STAT, features[0], [39, 40], ['GK'], 'desc')),
+        'explore-position-counts': (explore.update_position_counts, (STAT, [18, 30])),
+        'search-page': (search.update_search_charts, (STAT, features[:4], PLAYERS, 'page', features[2], 0)),
+        'search-page-two': (search.update_search_charts, (STAT, features[:3], [], 'page', features[0], 1)),
+        'search-distribution': (search.update_search_charts, (STAT, features[:4], [], 'distribution', None, 0)),
+        'search-similar-players': (search.add_similar_players,
+                                   (1, STAT, features[:5], PLAYERS[:2], [], 3, 'cosine', PLAYERS[:2])),
+        'compare-charts': (compare.update_compare_charts, (STAT, features[:5], PLAYERS)),
+        'compare-charts-other-table': (compare.update_compare_charts, ('player_gca', gca_features[:3], PLAYERS[:2])),
+        'compare-charts-no-players': (compare.update_compare_charts, (STAT, features[:5], [])),
+        'compare-charts-no-table': (compare.update_compare_charts, (None, [], PLAYERS)),
+    }
+
+
+def as_json(value):
+    return json.loads(json.dumps(value, cls=PlotlyJSONEncoder))
+
+
+# Replaces the template of every figure within value by the trace types it keeps of the default template, '*' when it
+# is the whole default template. A template that is not part of the default template is left as it is.
+def shared_template(value, template):
+    if isinstance(value, list):
+        return [shared_template(item, template) for item in value]
+    if not isinstance(value, dict):
+        return value
+    layout = value.get('layout')
+    if 'data' in value and isinstance(layout, dict) and isinstance(layout.get('template'), dict):
+        kept = layout['template']
+        types = sorted(kept.get('data', {}))
+        if kept == template:
+            value = {**value, 'layout': {**layout, 'template': '*'}}
+        elif set(types) <= set(template['data']) \
+                and kept == {**template, 'data': {trace_type: template['data'][trace_type] for trace_type in types}}:
+            value = {**value, 'layout': {**layout, 'template': types}}
+    return {key: shared_template(item, template) for key, item in value.items()}
+
+
+def callback_outputs(tables, monkeypatch):
+    monkeypatch.setattr(figures, 'compact_figure', lambda figure: payload.compact_figure(figure, typed_arrays=False))
+    template = as_json(figures.template())
+    outputs = {}
+    for name, (func, args) in callback_calls(tables).items():
+        outputs[name] = shared_template(as_json(getattr(func, '__wrapped__', func)(*args)), template)
+    return {'template': template, 'outputs': outputs}
+
+
+def saved_outputs():
+    with open(GOLDEN_PATH, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def test_the_default_template_did_not_change():
+    assert as_json(figures.template()) == saved_outputs()['template']
+
+
+def test_callbacks_match_the_saved_outputs(tables, monkeypatch):
+    outputs = callback_outputs(tables, monkeypatch)['outputs']
+    saved = saved_outputs()['outputs']
+    assert sorted(outputs) == sorted(saved)
+    for name, output in outputs.items():
+        assert output == saved[name], name
+
+
+if __name__ == '__main__':
+    from conftest import install_tables
+
+    with pytest.MonkeyPatch.context() as patch:
+        saved = callback_outputs(install_tables(), patch)
+    os.makedirs(os.path.dirname(GOLDEN_PATH), exist_ok=True)
+    with open(GOLDEN_PATH, 'w', encoding='utf-8') as f:
+        json.dump(saved, f, indent=1, sort_keys=True)
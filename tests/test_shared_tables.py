@@ -0,0 +1,77 @@
+# The tables of the registry are shared by all callbacks (and all users), a callback may only read them. Every callback
+# of the tabs is run with typical inputs, and the shared table has to be exactly the same afterwards.
+
+import pandas as pd
+import pytest
+
+STAT = 'player_defense'
+
+
+def unwrap(func):
+    return getattr(func, '__wrapped__', func)
+
+
+def frame_hash(df):
+    return list(df.columns), [str(dtype) for dtype in df.dtypes], int(pd.util.hash_pandas_object(df).sum())
+
+
+def callback_calls(table):
+    from viz_app.tabs import explore, search, compare
+    import visualization_app
+
+    features = table.schema.radar_features
+    players = list(dict.fromkeys(table.frame['player']))[:8]
+    teams = list(table.facets.values('team'))[:3]
+    return {
+        'explore.update_position_counts': (explore.update_position_counts, (STAT, [18, 30])),
+        'explore.update_explore_dropdown_and_chart': (explore.update_explore_dropdown_and_chart,
+                                                      (STAT, features[0], [18, 30], ['DF', 'MF'], 'desc')),
+        'explore.update_explore_dropdown_and_chart (ascending)': (explore.update_explore_dropdown_and_chart,
+                                                                  (STAT, features[1], [15, 40], None, 'asc')),
+        'search.update_feature_and_team_dropdown': (search.update_feature_and_team_dropdown, (STAT,)),
+        'search.update_player_dropdown': (search.update_player_dropdown, (teams, STAT)),
+        'search.update_bar_sort_dropdown': (search.update_bar_sort_dropdown, (STAT, features[:3], features[1])),
+        'search.update_search_charts': (search.update_search_charts,
+                                        (STAT, features[:4], players, 'page', features[2], 0)),
+        'search.update_search_charts (distribution)': (search.update_search_charts,
+                                                       (STAT, features[:4], [], 'distribution', None, 0)),
+        'search.add_similar_players': (search.add_similar_players,
+                                       (1, STAT, features[:5], players[:2], [], 5, 'cosine', players[:2])),
+        'compare.update_compare_stat_and_feature_dropdown': (compare.update_compare_stat_and_feature_dropdown, (STAT,)),
+        'compare.update_compare_charts': (compare.update_compare_charts, (STAT, features[:5], players)),
+        'app.update_selection': (visualization_app.update_selection, (players,)),
+    }
+
+
+def test_callbacks_do_not_change_the_shared_table(tables):
+    before = frame_hash(tables[STAT])
+    for name, (func, args) in callback_calls(tables.table(STAT)).items():
+        unwrap(func)(*args)
+        assert frame_hash(tables[STAT]) == before, f'{name} changed the shared table'
+
+
+def set_column(df):
+    df[df.columns[-1]] = 0
+
+
+def add_column(df):
+    df['tmp'] = 1
+
+
+def set_cell(df):
+    df.iloc[0, 0] = 'X'
+
+
+def set_rows(df):
+    df.loc[df.index[:5], df.columns[-1]] = -1
+
+
+# the frames the registry hands out are copy-on-write views, changing one leaves the shared table as it is
+@pytest.mark.parametrize('change', [set_column, add_column, set_cell, set_rows])
+def test_changing_a_table_does_not_change_the_shared_table(tables, change):
+    before = frame_hash(tables[STAT])
+    df = tables[STAT]
+    change(df)
+    table = tables.table(STAT)
+    change(table.frame)
+    assert frame_hash(tables[STAT]) == before
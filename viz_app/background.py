@@ -0,0 +1,110 @@
+# The heavy callbacks (the ones building the charts of the search and compare tabs from the tables) can run as Dash
+# background callbacks, each call in its own process managed through a diskcache folder (see background_callbacks in
+# config.py). The server threads then stay free for the cheap callbacks while the charts are built on the other cores,
+# and a call that is superseded by a newer one of the same callback is terminated instead of run to completion.
+# A background call runs in a process forked from the worker, so whatever it stores in the memory of that process (the
+# tables it loads, the figures it caches, the timings of the instrumentation) is gone once it ends. Background callbacks
+# are therefore only used when:
+#   - the figures are shared through the disk tier of the figure cache (figure_cache_path)
+#   - the instrumentation is switched off, its timings would otherwise be recorded in the forked process only
+#   - processes are forked, so they inherit the table the worker loads before the call (see install_table_loading)
+#   - the optional diskcache, multiprocess and psutil packages are installed (pip install "dash[diskcache]")
+# Otherwise the heavy callbacks run as normal callbacks.
+#
+# Inputs that fire in bursts are debounced in the browser as well: debounce() copies the value of an input to a store
+# once it did not change for debounce_ms, and the heavy callback listens to that store instead of to the input.
+
+import logging
+import multiprocessing
+
+from dash import clientside_callback, Input, Output, State
+
+from viz_app.config import background_callbacks, background_cache_path, background_interval, debounce_ms, \
+    figure_cache_path, instrument_callbacks
+
+logger = logging.getLogger(__name__)
+
+
+def create_manager():
+    if not background_callbacks:
+        return None
+    if figure_cache_path is None or instrument_callbacks or multiprocessing.get_start_method() != 'fork':
+        logger.info('the heavy callbacks run as normal callbacks, background callbacks need a shared figure cache, '
+                    'forked processes and no instrumentation')
+        return None
+    try:
+        import diskcache
+        from dash import DiskcacheManager
+        return DiskcacheManager(diskcache.Cache(background_cache_path))
+    except ImportError:
+        logger.info('diskcache is not installed, the heavy callbacks run as normal callbacks')
+        return None
+
+
+# the manager of the background callbacks, None when they are switched off or not available
+manager = create_manager()
+
+# the ids of the inputs that select the table of the heavy callbacks (the stats dropdowns of the search and compare tabs)
+TABLE_INPUTS = ('stats-dropdown', 'compare-stats-dropdown')
+
+
+# Loads the table selected by a callback request in the worker, before Dash forks the process of a background call
+# from it. The forked process inherits the loaded table, instead of loading it by itself and losing it again when it
+# ends. Only the selected table is loaded, the other tables stay unloaded until a callback asks for them. A table that
+# cannot be loaded is logged and left to the callback, which then fails the way a normal callback would.
+def install_table_loading(app, registry):
+    from flask import request
+
+    endpoint = app.config.routes_pathname_prefix + '_dash-update-component'
+
+    def load_selected_table():
+        if request.endpoint != endpoint:
+            return
+        body = request.get_json(silent=True) or {}
+        for item in [*body.get('inputs', []), *body.get('state', [])]:
+            name = item.get('value') if isinstance(item, dict) and item.get('id') in TABLE_INPUTS else None
+            if not isinstance(name, str) or name not in registry:
+                continue
+            try:
+                registry.table(name)
+            except Exception:
+                logger.exception('could not load the table %s before the background call', name)
+
+    app.server.before_request(load_selected_table)
+    return app
+
+
+# The keyword arguments of a heavy callback: running sets the given outputs while the callback runs (e.g. a status
+# text), which works for normal callbacks as well. With the background manager the callback runs in the background and
+# is cancelled when one of the cancel inputs changes.
+def heavy_callback(running=(), cancel=()):
+    options = {'running': list(running)} if running else {}
+    if manager is not None:
+        options.update({'background': True, 'manager': manager, 'interval': background_interval})
+        if cancel:
+            options['cancel'] = list(cancel)
+    return options
+
+
+# Copies the value of the property of the source component to the data of the target store once the value did not
+# change for debounce_ms. Every change starts a timer, a change that is superseded before its timer ends is dropped.
+# The value is only copied when it differs from what the store holds already.
+def debounce(source, prop, target):
+    clientside_callback(
+        """
+        function(value, current) {
+            var timers = window._scoutlierDebounce = window._scoutlierDebounce || {};
+            var token = (timers['%(target)s'] || 0) + 1;
+            timers['%(target)s'] = token;
+            return new Promise(function(resolve) {
+                setTimeout(function() {
+                    var latest = timers['%(target)s'] === token;
+                    var changed = JSON.stringify(value) !== JSON.stringify(current);
+                    resolve(latest && changed ? value : window.dash_clientside.no_update);
+                }, %(delay)d);
+            });
+        }
+        """ % {'target': target, 'delay': debounce_ms},
+        Output(target, 'data'),
+        Input(source, prop),
+        State(target, 'data'))
@@ -0,0 +1,357 @@
+# This file contains the on-disk table cache. Every csv file is converted once into a folder of raw binary column files
+# plus a small meta.json, after which later boots memory map those columns instead of parsing the csv again.
+# The meta data holds the mtime, size and sha1 of the source file, so a changed csv is detected and the cache rebuilt.
+#
+# Layout of a cached table (one folder per table):
+#   meta.json          -> source fingerprint, row count and the column descriptions
+#   <i>.bin            -> numeric column, raw little endian values of the stored dtype
+#   <i>.codes.bin      -> categorical column codes, the categories themselves are stored in meta.json
+#   <i>.offsets.bin    -> string column offsets (int64, rows + 1) into <i>.data.bin, which holds the utf-8 text
+#   <i>.valid.bin      -> string column validity mask, False marks a missing value
+#   derived/<key>/     -> arrays derived from the table (e.g. the sorted orders of the ranking index), see write_arrays
+#
+# The columns and derived arrays are memory mapped read only, so all processes on a host share the same physical pages
+# (through the page cache) instead of each holding a private copy of every table.
+
+import hashlib
+import mmap
+import json
+import logging
+import os
+import shutil
+import time
+from collections import deque
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+
+from viz_app.config import cache_path
+
+try:
+    import fcntl
+except ImportError:
+    # e.g. on Windows, where the processes of a host then do not wait for each other
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# bump this whenever the on-disk layout changes, older caches are then rebuilt automatically
+CACHE_FORMAT_VERSION = 1
+
+# counters and the most recent events of the cache, readable through get_cache_report()
+_report = {'hit': 0, 'miss': 0, 'rebuild': 0, 'events': deque(maxlen=100)}
+
+
+# the hash is only computed when the mtime or size differs from the one stored in the cache
+def file_sha1(path, block_size=1 << 20):
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def get_cache_report():
+    return {'hit': _report['hit'], 'miss': _report['miss'], 'rebuild': _report['rebuild'],
+            'events': list(_report['events'])}
+
+
+def _record(name, outcome, seconds):
+    _report[outcome] += 1
+    _report['events'].append({'table': name, 'outcome': outcome, 'seconds': seconds, 'time': time.time()})
+    logger.info('table cache %s for %s in %.1f ms', outcome, name, seconds * 1000)
+
+
+def _table_dir(name):
+    return os.path.join(cache_path, *name.split('/'))
+
+
+# Holds an exclusive lock on the lock file called name (in the locks folder of the cache) within the with block. The
+# lock is shared by all processes on the host, so e.g. one worker rebuilds a changed table while the others wait for it
+# and then find the cache up to date.
+@contextmanager
+def file_lock(name):
+    if fcntl is None:
+        yield
+        return
+    folder = os.path.join(cache_path, 'locks')
+    os.makedirs(folder, exist_ok=True)
+    with open(os.path.join(folder, f'{name}.lock'), 'a') as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def _read_meta(folder):
+    try:
+        with open(os.path.join(folder, 'meta.json')) as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if meta.get('format') != CACHE_FORMAT_VERSION:
+        return None
+    return meta
+
+
+def _write_meta(folder, meta):
+    tmp = os.path.join(folder, 'meta.json.tmp')
+    with open(tmp, 'w') as f:
+        json.dump(meta, f)
+    os.replace(tmp, os.path.join(folder, 'meta.json'))
+
+
+# memory maps a column file read only, empty tables cannot be mapped so they get an empty array instead
+def _map(folder, file_name, dtype, count):
+    if count == 0:
+        return np.empty(0, dtype=dtype)
+    # a plain ndarray view keeps the mapping alive without leaking the memmap subclass into pandas
+    return np.memmap(os.path.join(folder, file_name), dtype=dtype, mode='r', shape=(count,)).view(np.ndarray)
+
+
+# the description (as stored in meta.json) of how a column is stored, derived from its dtype
+def describe_column(series):
+    dtype = series.dtype
+    if isinstance(dtype, pd.CategoricalDtype):
+        codes_dtype = series.cat.codes.dtype
+        return {'kind': 'category', 'dtype': codes_dtype.str, 'categories': dtype.categories.tolist(),
+                'ordered': bool(dtype.ordered)}
+    if isinstance(dtype, np.dtype) and dtype.kind in 'biuf':
+        return {'kind': 'numeric', 'dtype': dtype.str}
+    # everything else is stored as text, which covers object columns as well as the pandas string dtypes
+    return {'kind': 'string'}
+
+
+# Writes a table into the cache a part of the rows at a time, so a table can be written while it is read (see
+# ingest.py) without ever holding all of it in memory. The columns are described up front (see describe_column), every
+# part appended must hold those columns, after which commit() swaps the finished table into the cache.
+class TableWriter:
+
+    def __init__(self, name, columns):
+        self.name = name
+        self.columns = columns
+        self.rows = 0
+        self.folder = _table_dir(name)
+        self.tmp_folder = f'{self.folder}.tmp-{os.getpid()}'
+        shutil.rmtree(self.tmp_folder, ignore_errors=True)
+        os.makedirs(self.tmp_folder)
+
+        self._files = []
+        self._text_sizes = []
+        for i, column in enumerate(columns):
+            if column['kind'] == 'numeric':
+                files = {'values': self._open(f'{i}.bin')}
+            elif column['kind'] == 'category':
+                files = {'codes': self._open(f'{i}.codes.bin')}
+            else:
+                files = {'offsets': self._open(f'{i}.offsets.bin'), 'valid': self._open(f'{i}.valid.bin'),
+                         'data': self._open(f'{i}.data.bin')}
+                np.zeros(1, dtype=np.int64).tofile(files['offsets'])
+            self._files.append(files)
+            self._text_sizes.append(0)
+
+    def _open(self, file_name):
+        return open(os.path.join(self.tmp_folder, file_name), 'wb')
+
+    def append(self, df):
+        for i, column in enumerate(self.columns):
+            series = df[column['name']]
+            files = self._files[i]
+            if column['kind'] == 'numeric':
+                np.ascontiguousarray(series.to_numpy(dtype=np.dtype(column['dtype']))).tofile(files['values'])
+            elif column['kind'] == 'category':
+                dtype = pd.CategoricalDtype(column['categories'], ordered=column['ordered'])
+                codes = pd.Categorical(series, dtype=dtype).codes
+                codes.astype(np.dtype(column['dtype']), copy=False).tofile(files['codes'])
+            else:
+                values = series.astype(object).to_numpy()
+                valid = pd.notna(values)
+                encoded = [str(v).encode('utf-8') if ok else b'' for v, ok in zip(values, valid)]
+                offsets = np.cumsum([len(b) for b in encoded], dtype=np.int64) + self._text_sizes[i]
+                if len(offsets):
+                    self._text_sizes[i] = int(offsets[-1])
+                offsets.tofile(files['offsets'])
+                valid.astype(np.bool_).tofile(files['valid'])
+                files['data'].write(b''.join(encoded))
+        self.rows += len(df)
+
+    def _close(self):
+        for files in self._files:
+            for f in files.values():
+                f.close()
+
+    # swaps the finished folder in, so a concurrently booting worker never reads a half written cache
+    def commit(self, source):
+        self._close()
+        _write_meta(self.tmp_folder, {'format': CACHE_FORMAT_VERSION, 'source': source, 'rows': self.rows,
+                                      'columns': self.columns})
+        old_folder = f'{self.folder}.old-{os.getpid()}'
+        if os.path.exists(self.folder):
+            os.replace(self.folder, old_folder)
+        os.replace(self.tmp_folder, self.folder)
+        shutil.rmtree(old_folder, ignore_errors=True)
+
+    def abort(self):
+        self._close()
+        shutil.rmtree(self.tmp_folder, ignore_errors=True)
+
+
+def _read_column(folder, i, column, rows):
+    if column['kind'] == 'numeric':
+        return _map(folder, f'{i}.bin', np.dtype(column['dtype']), rows)
+
+    if column['kind'] == 'category':
+        codes = _map(folder, f'{i}.codes.bin', np.dtype(column['dtype']), rows)
+        dtype = pd.CategoricalDtype(column['categories'], ordered=column['ordered'])
+        return pd.Categorical.from_codes(codes, dtype=dtype)
+
+    offsets = _map(folder, f'{i}.offsets.bin', np.int64, rows + 1)
+    valid = _map(folder, f'{i}.valid.bin', np.bool_, rows)
+    with open(os.path.join(folder, f'{i}.data.bin'), 'rb') as f:
+        data = f.read()
+    values = np.empty(rows, dtype=object)
+    for row in range(rows):
+        values[row] = data[offsets[row]:offsets[row + 1]].decode('utf-8') if valid[row] else None
+    return values
+
+
+def write_table(name, df, source):
+    writer = TableWriter(name, [{'name': column, **describe_column(df[column])} for column in df.columns])
+    try:
+        writer.append(df)
+        writer.commit(source)
+    except BaseException:
+        writer.abort()
+        raise
+
+
+def read_table(name):
+    folder = _table_dir(name)
+    meta = _read_meta(folder)
+    if meta is None:
+        return None
+
+    rows = meta['rows']
+    data = {column['name']: _read_column(folder, i, column, rows) for i, column in enumerate(meta['columns'])}
+    # copy=False keeps the numeric columns backed by the memory mapped files
+    df = pd.DataFrame(data, columns=[column['name'] for column in meta['columns']], copy=False)
+    df.attrs['source_version'] = meta['source']['sha1']
+    df.attrs['cache_name'] = name
+    return df
+
+
+# Stores arrays derived from a cached table (a dictionary of labels to 1-d arrays) next to its columns, so they are
+# memory mapped and shared between processes as well. The arrays are thrown away along with the table cache when the
+# source changes, and are checked against the version they were derived from when they are read.
+def write_arrays(name, key, arrays, version):
+    folder = os.path.join(_table_dir(name), 'derived', key)
+    tmp_folder = f'{folder}.tmp-{os.getpid()}'
+    shutil.rmtree(tmp_folder, ignore_errors=True)
+    os.makedirs(tmp_folder)
+
+    entries = []
+    for i, (label, values) in enumerate(arrays.items()):
+        values = np.ascontiguousarray(values)
+        values.tofile(os.path.join(tmp_folder, f'{i}.bin'))
+        entries.append({'label': label, 'dtype': values.dtype.str, 'count': len(values)})
+    _write_meta(tmp_folder, {'format': CACHE_FORMAT_VERSION, 'version': version, 'arrays': entries})
+
+    old_folder = f'{folder}.old-{os.getpid()}'
+    if os.path.exists(folder):
+        os.replace(folder, old_folder)
+    os.replace(tmp_folder, folder)
+    shutil.rmtree(old_folder, ignore_errors=True)
+
+
+# the derived arrays of the table as a dictionary of memory mapped arrays, or None when they were not stored (yet) for
+# this version
+def read_arrays(name, key, version):
+    folder = os.path.join(_table_dir(name), 'derived', key)
+    meta = _read_meta(folder)
+    if meta is None or meta['version'] != version:
+        return None
+    return {entry['label']: _map(folder, f'{i}.bin', np.dtype(entry['dtype']), entry['count'])
+            for i, entry in enumerate(meta['arrays'])}
+
+
+# whether the array is backed by a memory mapped file, and thereby shared with the other processes
+def is_mapped(values):
+    while values is not None:
+        if isinstance(values, (np.memmap, mmap.mmap)):
+            return True
+        values = getattr(values, 'base', None)
+    return False
+
+
+# Loads the table called name (e.g. 'player/player_defense') from the cache, (re)building it with reader(source_path)
+# when there is no cache yet or the source file changed. The variant is stored along with the cache so a change in the
+# way the table is prepared (reader) also invalidates older caches. When ingest is given, the cache is (re)built with
+# ingest(name, source_path, source) instead, which writes the table into the cache itself (e.g. streaming it in parts),
+# the reader is then only used when the cache cannot be written.
+def load_cached(name, source_path, reader, variant='', ingest=None):
+    start = time.perf_counter()
+    folder = _table_dir(name)
+    stat = os.stat(source_path)
+    meta = _read_meta(folder)
+
+    if meta is not None and meta['source'].get('variant') == variant:
+        source = meta['source']
+        fresh = source['mtime'] == stat.st_mtime and source['size'] == stat.st_size
+        if not fresh and source['size'] == stat.st_size and source['sha1'] == file_sha1(source_path):
+            # the file was touched but the contents are the same, so only the stored mtime needs updating
+            source['mtime'] = stat.st_mtime
+            _write_meta(folder, meta)
+            fresh = True
+        if fresh:
+            df = read_table(name)
+            if df is not None:
+                _record(name, 'hit', time.perf_counter() - start)
+                return df
+
+    outcome = 'miss' if meta is None else 'rebuild'
+    source = {'path': source_path, 'mtime': stat.st_mtime, 'size': stat.st_size, 'sha1': file_sha1(source_path),
+              'variant': variant}
+    df = None
+    try:
+        if ingest is not None:
+            ingest(name, source_path, source)
+        else:
+            df = reader(source_path)
+            write_table(name, df, source)
+        # read the table back so callers always get the same (memory mapped) representation
+        df = read_table(name)
+    except OSError:
+        logger.exception('could not write the table cache for %s, using the csv data directly', name)
+        if df is None:
+            df = reader(source_path)
+        df.attrs['source_version'] = source['sha1']
+    _record(name, outcome, time.perf_counter() - start)
+    return df
+
+
+# Loads a table that is built from other tables (e.g. the combined player table, see combined.py) instead of from a
+# csv file. source describes the inputs of the table, its sha1 is the version of the table. build(previous, sources)
+# builds the table, it gets the table that was cached before and the source it was built from (both None when there is
+# none), so the parts whose inputs did not change can be reused instead of built again.
+def load_built(name, source, build):
+    start = time.perf_counter()
+    meta = _read_meta(_table_dir(name))
+    if meta is not None and meta['source'].get('sha1') == source['sha1']:
+        df = read_table(name)
+        if df is not None:
+            _record(name, 'hit', time.perf_counter() - start)
+            return df
+
+    outcome = 'miss' if meta is None else 'rebuild'
+    previous = read_table(name) if meta is not None else None
+    df = build(previous, meta['source'] if previous is not None else None)
+    try:
+        write_table(name, df, source)
+        df = read_table(name)
+    except OSError:
+        logger.exception('could not write the table cache for %s, using the built table directly', name)
+        df.attrs['source_version'] = source['sha1']
+    _record(name, outcome, time.perf_counter() - start)
+    return df
@@ -0,0 +1,101 @@
+# The combined player table: every player table (see player_tables in config.py) joined on the player into one wide
+# table, so the search and compare tabs can mix features of several categories (e.g. defense, passing and shooting) in
+# one chart. The table holds one row per player, taken from the first row of that player in every table (the row the
+# charts use as well), and is offered in the tabs as one more table under the name combined_table.
+#   identity columns -> player, team, position, club and age, taken from the first table the player appears in
+#   feature columns  -> every numeric column of every table, namespaced with the category: tkl of player_defense
+#                       becomes defense.tkl. A player missing from a table has no values (NaN) for its features.
+# The table is built once and stored in the table cache like the other tables. When a player table changes, only the
+# columns of that table are joined again, the columns of the other tables are taken from the previously cached table.
+
+import hashlib
+import json
+
+import numpy as np
+import pandas as pd
+
+from viz_app.cache import load_built
+from viz_app.config import player_tables, combined_table, exclude_columns, use_table_cache
+from viz_app.data import get_player_data, normalize_table, prepare_player_table, load_player_table, \
+    NORMALIZATION_VERSION
+
+IDENTITY_COLUMNS = ['player', 'team', 'position', 'club', 'age']
+
+
+# loads any table of the registry, the combined table is joined from the player tables
+def load_table(name):
+    if name == combined_table:
+        return prepare_player_table(name, get_combined_data())
+    return load_player_table(name)
+
+
+# the name of a feature of a player table within the combined table, e.g. defense.tkl
+def namespaced(table, feature):
+    return '{}.{}'.format(table.replace('player_', '', 1), feature)
+
+
+def get_combined_data(tables=None):
+    tables = list(player_tables if tables is None else tables)
+    frames = {table: get_player_data(table) for table in tables}
+    versions = {table: frames[table].attrs.get('source_version', '') for table in tables}
+    variant = [NORMALIZATION_VERSION, sorted(exclude_columns)]
+    sha1 = hashlib.sha1(json.dumps([versions, variant], sort_keys=True).encode()).hexdigest()
+
+    if not use_table_cache:
+        df = combine_tables(frames)
+        df.attrs['source_version'] = sha1
+        return df
+
+    def build(previous, source):
+        # the columns of the tables that did not change since the previous table was built are reused
+        reused = set()
+        if previous is not None and source.get('variant') == variant:
+            reused = {table for table in tables if source['tables'].get(table) == versions[table]}
+        return combine_tables(frames, previous, reused)
+
+    return load_built('combined/{}'.format(combined_table), {'sha1': sha1, 'variant': variant, 'tables': versions},
+                      build)
+
+
+# Joins the frames (a dictionary of table names to normalized player tables) into the combined table. The feature
+# columns of the tables in reused are taken from previous, the combined table built before, instead of the frames.
+def combine_tables(frames, previous=None, reused=()):
+    # the first row of every player in every table, and the players in order of their first appearance over the tables
+    firsts = {table: np.flatnonzero(~df['player'].duplicated().to_numpy()) for table, df in frames.items()}
+    names = {table: df['player'].to_numpy()[firsts[table]] for table, df in frames.items()}
+    players = pd.Index(pd.unique(np.concatenate([*names.values(), np.empty(0, dtype=object)])))
+
+    columns = {'player': players.to_numpy()}
+    # the identity columns of every player come from the first table that has a value for them
+    for column in IDENTITY_COLUMNS[1:]:
+        values = pd.Series(np.nan, index=players, dtype=object)
+        for table, df in frames.items():
+            if column in df.columns:
+                part = pd.Series(df[column].to_numpy(dtype=object)[firsts[table]], index=names[table])
+                values = values.where(values.notna(), part.reindex(players))
+        if values.notna().any():
+            # the age is numeric already in every table
+            columns[column] = pd.to_numeric(values).to_numpy() if column == 'age' else values.to_numpy()
+
+    if previous is not None:
+        previous_rows = pd.Index(previous['player']).get_indexer(players)
+    for table, df in frames.items():
+        rows = players.get_indexer(names[table])
+        for feature in df.columns:
+            if feature in IDENTITY_COLUMNS or feature in exclude_columns or not _is_feature(df[feature]):
+                continue
+            name = namespaced(table, feature)
+            if table in reused and name in previous.columns:
+                # the rows of the previous table moved to the rows of the same players, new players have no values
+                values = previous[name].to_numpy(dtype=np.float64)
+                values = np.where(previous_rows >= 0, values[previous_rows], np.nan)
+            else:
+                values = np.full(len(players), np.nan)
+                values[rows] = df[feature].to_numpy(dtype=np.float64, na_value=np.nan)[firsts[table]]
+            columns[name] = values
+
+    return normalize_table(pd.DataFrame(columns, copy=False))
+
+
+def _is_feature(column):
+    return pd.api.types.is_numeric_dtype(column) and not pd.api.types.is_bool_dtype(column)
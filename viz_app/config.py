@@ -1,4 +1,6 @@
 # Here you can add any global configuations
+import os
+
 
 # the names of the player tables, somewhat hard coded but functional and readable
 player_tables = \
@@ -14,7 +16,95 @@ player_tables = \
      'player_shooting',
      'player_stats']
 
+# All player tables joined on the player into one wide table (see combined.py), offered as one more table in the search
+# and compare tabs under this name so features of several categories can be shown together. Set it to None to leave
+# the combined table out.
+combined_table = 'player_combined'
+
+# Columns to exclude from the features shown in the charts, they are not read from the csv files at all
+exclude_columns = {'birth_year'}
+
+# These text columns have few distinct values, so they are stored as categoricals when a table is loaded
+categorical_columns = ['team', 'position', 'club']
+
 # Change the data path here to point to the data folder to run the application yourself
 # # should point to -> \JM0250 Data (2022-2023)\(JM0250 Data (2022-2023)\data\
 data_path = "C:\\Users\\bgrem\\Documents\\Data visualization\\JM0250 Data (2022-2023)\\JM0250 Data (2022-2023)\\Data\\"
 
+
+# The csv files are converted once into a binary column cache in this folder, later boots load that cache instead.
+# Set use_table_cache to False to always read the csv files directly.
+use_table_cache = True
+cache_path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), '.table_cache')
+
+# The csv files are streamed into the table cache this many rows at a time, which bounds the memory needed to load a
+# table. The dtypes of columns can be given explicitly per table (e.g. {'player_defense': {'tkl': 'int16'}}), the
+# dtypes of all other columns are worked out from the data.
+ingest_chunk_rows = 50000
+ingest_dtypes = {}
+
+# The player tables are loaded on demand. Once the loaded tables take more memory than this budget (in bytes), the least
+# recently used tables are dropped again. Set it to None to keep every table that has been loaded.
+table_memory_budget = 256 * 1024 * 1024
+
+# The number of players shown in the leaderboard of the explore tab
+leaderboard_size = 10
+
+# The bar chart of the search tab shows the players page by page, sorted on a feature, with search_page_size players
+# on a page. When no players are selected and the table has more than search_distribution_rows rows, it shows the
+# distribution of the features instead (search_bins bins per feature). No bar chart holds more than search_max_points
+# bars, the page size and the number of bins are lowered to stay within it.
+search_page_size = 25
+search_bins = 20
+search_distribution_rows = 5000
+search_max_points = 2000
+
+# The number of similar players the search tab adds for every selected player by default, and the default metric of
+# the similarity search (see similarity.py), either 'cosine' or 'euclidean'
+similar_players_count = 5
+similar_players_metric = 'cosine'
+
+# The figures built by the callbacks are cached per process, bounded in the number of figures and in bytes, and shared
+# between the workers on a host through the folder figure_cache_path (the precomputed leaderboards live there as well).
+# Set figure_cache_path to None to keep the figures per process only.
+figure_cache_size = 512
+figure_cache_bytes = 64 * 1024 * 1024
+figure_cache_path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), '.figure_cache')
+figure_cache_disk_bytes = 512 * 1024 * 1024
+
+# The figures sent to the browser are kept compact (see payload.py): their numbers are rounded to figure_decimals
+# decimals (None keeps them as they are) and, with figure_typed_arrays, sent as binary arrays when the plotly.js used by
+# dcc.Graph supports it. With compress_responses the responses of the callbacks of at least compress_min_bytes are
+# compressed with brotli (when installed) or gzip at compress_level.
+figure_decimals = 4
+figure_typed_arrays = True
+compress_responses = True
+compress_min_bytes = 500
+compress_level = 6
+
+# Opt-in instrumentation of the callbacks (see instrumentation.py). When switched on, the timings of every callback are
+# served in the Prometheus text format at /metrics and on a debug page at /_debug/callbacks, and single slow requests
+# can be profiled through /_debug/profile.
+instrument_callbacks = False
+
+# The leaderboards of the explore tab for the common filters below are built by this many processes into the disk tier
+# of the figure cache (see precompute.py), once by the gunicorn master before the workers start. Without
+# figure_cache_path they are not precomputed. Set precompute_workers to 0 to switch it off.
+precompute_workers = 2
+precompute_positions = [None, ['GK'], ['DF'], ['MF'], ['FW']]
+precompute_age_ranges = [[15, 40]]
+precompute_orders = ['desc']
+
+# The callbacks building the charts of the search and compare tabs run as background callbacks, each call in its own
+# process, when the optional diskcache package is installed and figure_cache_path is set (see background.py for all
+# conditions). The jobs are kept in background_cache_path and polled every background_interval milliseconds. Inputs
+# that change in bursts (the age slider, the position filter and the player selection) are only passed on once they
+# did not change for debounce_ms milliseconds.
+background_callbacks = True
+background_cache_path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), '.background_cache')
+background_interval = 100
+debounce_ms = 300
+
+# Changed csv files in the data folders are picked up while the app runs (see reload.py), the files are checked every
+# this many seconds. Set it to None to switch the watcher off.
+reload_interval = 5
@@ -1,19 +1,250 @@
+import json
+import os
+from dataclasses import dataclass
+
+import numpy as np
 import pandas as pd
-from viz_app.config import data_path
+from viz_app.config import data_path, use_table_cache, exclude_columns, categorical_columns, ingest_chunk_rows, \
+    ingest_dtypes
+from viz_app.cache import load_cached, file_sha1, read_arrays, write_arrays, is_mapped
+from viz_app.indexes import PlayerIndex, RankingIndex, FacetIndex
+from viz_app.similarity import SimilarityIndex
+from viz_app.stats import ColumnStats
 
+# bump this whenever normalize_table changes, so cached tables are normalized again
+NORMALIZATION_VERSION = 2
 
-# here we retrieve data from the player tables using the data format of the data provided.
-def get_player_data(table):
 
-    player_data_path = "{}Fifa World Cup 2022 Player Data\\{}.csv".format(data_path, table)
-    df = pd.read_csv(player_data_path)
+def player_data_path(table):
+    return os.path.join(data_path, 'Fifa World Cup 2022 Player Data', '{}.csv'.format(table))
+
+
+def team_data_path(table):
+    return os.path.join(data_path, 'Fifa World Cup 2022 Team Data', '{}.csv'.format(table))
+
+
+# The age column is provided as 'years-days' (e.g. '28-123'), we only keep the years as an integer
+def parse_age(age):
+    if pd.api.types.is_numeric_dtype(age):
+        return age
+    return pd.to_numeric(age.astype(str).str[:2], errors='coerce')
+
+
+# Downcasts a numeric column to the smallest dtype that holds its values. Integers are always downcast, floats only
+# when float32 represents every value exactly, so no statistic changes by being stored smaller.
+def downcast(column):
+    if pd.api.types.is_bool_dtype(column) or not pd.api.types.is_numeric_dtype(column):
+        return column
+
+    if pd.api.types.is_integer_dtype(column):
+        return pd.to_numeric(column, downcast='integer')
+
+    smaller = column.astype(np.float32)
+    if np.array_equal(smaller.to_numpy(np.float64), column.to_numpy(np.float64), equal_nan=True):
+        return smaller
+    return column
+
 
+# The normalization that used to happen in the callbacks, now done once when a table is read: the age gets parsed,
+# numeric columns are downcast and the text columns with few distinct values are turned into categoricals.
+def normalize_table(df):
+    df = df.copy()
+    if 'age' in df.columns:
+        df['age'] = parse_age(df['age'])
+
+    for column in df.columns:
+        if column in categorical_columns:
+            df[column] = df[column].astype('category')
+        else:
+            df[column] = downcast(df[column])
     return df
 
 
+def _read_csv(path):
+    from viz_app.ingest import ingest_columns
+    return normalize_table(pd.read_csv(path, usecols=ingest_columns(path)))
+
+
+# Reads and normalizes a csv file, going through the binary table cache (see cache.py) unless it is disabled. The cache
+# is built by streaming the csv file into it in parts (see ingest.py), so loading a large file takes bounded memory.
+def _read_table(name, path):
+    if not use_table_cache:
+        df = _read_csv(path)
+        df.attrs['source_version'] = file_sha1(path)
+        return df
+
+    from viz_app.ingest import ingest_csv
+    dtypes = ingest_dtypes.get(name.split('/')[-1], {})
+    # a change in the excluded columns or the explicit dtypes changes the cached table, so they are part of the variant
+    variant = 'normalized-{}-{}'.format(NORMALIZATION_VERSION, json.dumps([sorted(exclude_columns), dtypes],
+                                                                         sort_keys=True))
+    return load_cached(name, path, _read_csv, variant=variant,
+                       ingest=lambda name, path, source: ingest_csv(name, path, source, ingest_chunk_rows, dtypes))
+
+
+# here we retrieve data from the player tables using the data format of the data provided.
+def get_player_data(table):
+    return _read_table('player/{}'.format(table), player_data_path(table))
+
+
 # similar function but for team datasets, not used
 def get_team_data(table):
-    team_data_path = "{}Fifa World Cup 2022 Team Data\\{}.csv".format(data_path, table)
-    df = pd.read_csv(team_data_path)
+    return _read_table('team/{}'.format(table), team_data_path(table))
 
-    return df
+
+# the names of the team tables, taken from the csv files in the team data folder
+def team_tables():
+    folder = os.path.dirname(team_data_path('x'))
+    try:
+        return sorted(name[:-len('.csv')] for name in os.listdir(folder) if name.endswith('.csv'))
+    except OSError:
+        return []
+
+
+# The feature lists of a table, computed once when the table is loaded instead of in every callback
+#   numeric_features -> the numeric columns which can be plotted as a feature (search and compare)
+#   radar_features   -> the numeric columns shown on the radar charts
+#   display_features -> the columns offered in the explore and compare feature dropdowns
+@dataclass(frozen=True)
+class TableSchema:
+    numeric_features: list
+    radar_features: list
+    display_features: list
+
+
+def build_schema(df):
+    numerics = [column for column in df.columns
+                if pd.api.types.is_numeric_dtype(df[column]) and not pd.api.types.is_bool_dtype(df[column])]
+    numeric_features = pd.Index(numerics).difference(['player', 'team', 'age']).difference(exclude_columns)
+    radar_features = pd.Index(numerics).difference([*exclude_columns, 'club', 'position', 'age', 'player', 'team'])
+    display_features = df.columns.difference([*exclude_columns, 'team', 'club'])
+    return TableSchema(list(numeric_features), list(radar_features), list(display_features))
+
+
+# Makes the column arrays of a frame read only. The tables are shared by all callbacks, which get copy-on-write views of
+# them from the registry (see registry.py). The numeric arrays taken from such a view (e.g. with to_numpy) are read only
+# as well, so writing to them fails loudly instead of silently changing the data for every other user. Columns that
+# are memory mapped from the table cache are read only already and are not copied.
+def freeze_frame(df):
+    columns = {}
+    for column in df.columns:
+        values = df[column].array
+        # only the numeric columns are frozen, extension arrays (e.g. the categoricals) and text columns are kept as
+        # they are, as pandas cannot compute the memory usage of read only text columns
+        if isinstance(df[column].dtype, np.dtype) and df[column].dtype.kind in 'biuf':
+            values = df[column].to_numpy()
+            if values.flags.writeable:
+                values = values.copy()
+                values.flags.writeable = False
+        columns[column] = values
+    frozen = pd.DataFrame(columns, index=df.index, copy=False)
+    frozen.attrs.update(df.attrs)
+    return frozen
+
+
+# A loaded player table: the normalized dataframe together with everything that is derived from it at load time.
+# The version identifies the contents of the table (the hash of the csv file and the normalization), everything that
+# is cached per table (like the figures) is keyed on it.
+@dataclass(frozen=True)
+class PlayerTable:
+    name: str
+    version: str
+    frame: pd.DataFrame
+    schema: TableSchema
+    players: PlayerIndex
+    stats: ColumnStats
+    ranking: RankingIndex
+    facets: FacetIndex
+    similarity: SimilarityIndex
+
+    # The bytes held by the table, split into the bytes shared with the other processes (memory mapped from the table
+    # cache) and the bytes private to this process
+    def memory(self):
+        shared = private = 0
+        arrays = [self.frame[column].array for column in self.frame.columns]
+        arrays = [getattr(values, 'codes', values) for values in arrays]
+        arrays += list(self.ranking.arrays().values()) + [self.similarity.matrix]
+        for values in arrays:
+            values = np.asarray(values)
+            if is_mapped(values):
+                shared += values.nbytes
+            else:
+                private += values.nbytes
+        # the text columns hold python strings, which are always private
+        private += int(self.frame.memory_usage(index=False, deep=True).sum()
+                       - self.frame.memory_usage(index=False, deep=False).sum())
+        return {'shared_bytes': shared, 'private_bytes': private}
+
+
+def load_player_table(table):
+    return prepare_player_table(table, get_player_data(table))
+
+
+# builds the PlayerTable (the indexes, statistics and schema) of a normalized frame
+def prepare_player_table(table, df):
+    df = freeze_frame(df)
+    schema = build_schema(df)
+    stats = ColumnStats(df, list(dict.fromkeys([*schema.numeric_features, *schema.radar_features])))
+    # the leaderboard can be sorted on any numeric feature of the explore dropdown
+    ranked = [feature for feature in schema.display_features
+              if pd.api.types.is_numeric_dtype(df[feature]) and not pd.api.types.is_bool_dtype(df[feature])]
+    version = '{}-{}'.format(df.attrs.get('source_version', ''), NORMALIZATION_VERSION)
+    players = PlayerIndex(df['player'])
+    return PlayerTable(table, version, df, schema, players, stats, build_ranking(df, ranked, version), FacetIndex(df),
+                       build_similarity(df, schema.numeric_features, stats, players, version))
+
+
+# The ranking index of a table read from the table cache is stored in that cache as well, so the process that builds
+# it first shares the sorted orders with all other processes (see materialize_tables). Tables that do not come from
+# the cache get a private ranking index.
+def build_ranking(df, features, version):
+    name = df.attrs.get('cache_name')
+    if name is None:
+        return RankingIndex(df, features)
+
+    arrays = read_arrays(name, 'ranking', version)
+    if arrays is not None and set(arrays) == {f'{direction}:{feature}' for feature in features
+                                               for direction in ('asc', 'desc')}:
+        return RankingIndex.from_arrays(arrays)
+
+    ranking = RankingIndex(df, features)
+    try:
+        write_arrays(name, 'ranking', ranking.arrays(), version)
+        return RankingIndex.from_arrays(read_arrays(name, 'ranking', version))
+    except OSError:
+        return ranking
+
+
+# The standardized feature matrix of the similarity search (see similarity.py), shared through the table cache in the
+# same way as the ranking index
+def build_similarity(df, features, stats, players, version):
+    name = df.attrs.get('cache_name')
+    if name is None:
+        return SimilarityIndex.build(df, features, stats, players)
+
+    names = df['player'].to_numpy()
+    arrays = read_arrays(name, 'similarity', version)
+    # the matrix is stored flat, its shape follows from the number of rows and features
+    if arrays is not None and set(arrays) == {'matrix'} and len(arrays['matrix']) == len(df) * len(features):
+        return SimilarityIndex(arrays['matrix'].reshape(len(df), len(features)), features, players, names)
+
+    index = SimilarityIndex.build(df, features, stats, players)
+    try:
+        write_arrays(name, 'similarity', {'matrix': index.matrix.ravel()}, version)
+        matrix = read_arrays(name, 'similarity', version)['matrix']
+        return SimilarityIndex(matrix.reshape(len(df), len(features)), features, players, names)
+    except OSError:
+        return index
+
+
+# Builds the table cache (including the ranking indexes and similarity matrices) of every table, and of the combined
+# table. Run once before the workers of a server start (see gunicorn.conf.py), so every worker only maps the shared
+# files instead of parsing and sorting the tables itself.
+def materialize_tables(player_tables, team_tables=(), combined_table=None):
+    for table in player_tables:
+        load_player_table(table)
+    if combined_table:
+        from viz_app.combined import load_table
+        load_table(combined_table)
+    for table in team_tables:
+        get_team_data(table)
@@ -0,0 +1,192 @@
+# The figure cache keeps the figures the callbacks built, keyed on the (normalized) callback inputs and the version of
+# the table the figure was built from. The same combinations of inputs come up over and over across users, so most
+# figures only have to be built once. The cache has two levels:
+#   memory -> a per process LRU holding the figures as plain dictionaries, bounded in entries and bytes
+#   disk   -> optional, a folder with the serialized figures shared by all workers on the host, bounded in bytes. The
+#             mtime of a file is its last use (it is updated on every disk hit), so the least recently used figures
+#             are removed first when the folder exceeds its bound.
+# Figures are stored as the plain dictionaries (the json) plotly produces, so a hit skips building and validating the
+# plotly objects altogether.
+
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import plotly.io as pio
+from plotly.utils import PlotlyJSONEncoder
+
+from viz_app.instrumentation import timed
+
+logger = logging.getLogger(__name__)
+
+
+# bump this whenever the figure builders (figures.py, payload.py) change their output, so the figures cached on disk by
+# an older version are built again
+FIGURE_FORMAT_VERSION = 3
+
+
+def figure_key(name, version, params):
+    text = json.dumps([FIGURE_FORMAT_VERSION, name, version, params], sort_keys=True, default=str)
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+
+# serializes a figure (a plotly figure or a plain dictionary) to its json text
+def figure_json(figure):
+    if isinstance(figure, dict):
+        return json.dumps(figure, cls=PlotlyJSONEncoder)
+    return pio.to_json(figure, validate=False)
+
+
+class FigureCache:
+
+    def __init__(self, max_entries=512, max_bytes=64 * 1024 * 1024, directory=None, max_disk_bytes=512 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.directory = directory
+        self.max_disk_bytes = max_disk_bytes
+        self._figures = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'disk_hits': 0, 'misses': 0, 'evictions': 0, 'build_seconds': 0.0}
+        self._writes = 0
+
+    # Returns the figure for the key as a dictionary, or None when it is not cached
+    def get(self, key):
+        with self._lock:
+            if key in self._figures:
+                self._figures.move_to_end(key)
+                self._stats['hits'] += 1
+                return self._figures[key][0]
+
+        text = self._read_disk(key)
+        if text is None:
+            with self._lock:
+                self._stats['misses'] += 1
+            return None
+
+        figure = json.loads(text)
+        with self._lock:
+            self._stats['disk_hits'] += 1
+        self._remember(key, figure, len(text))
+        return figure
+
+    # Stores the figure
+    def put(self, key, figure):
+        text = figure_json(figure)
+        figure = json.loads(text)
+        self._remember(key, figure, len(text))
+        self._write_disk(key, text)
+        return figure
+
+    # The figure for name (e.g. 'explore-bar') built from the table version and the callback inputs in params, taken
+    # from the cache or built using build() when it is not cached yet. Lists within params whose order does not matter
+    # (e.g. selected positions) should be sorted by the caller, so they end up with the same key.
+    # When the callbacks are instrumented, the build is counted as data access except for the time spent within the
+    # figure builders (which count as figure construction), the round trip to json in put() counts as serialization.
+    def cached_figure(self, name, version, params, build):
+        key = figure_key(name, version, params)
+        with timed('cache'):
+            figure = self.get(key)
+        if figure is None:
+            start = time.perf_counter()
+            with timed('data'):
+                built = build()
+            with timed('serialize'):
+                figure = self.put(key, built)
+            with self._lock:
+                self._stats['build_seconds'] += time.perf_counter() - start
+        return figure
+
+    def _remember(self, key, figure, size):
+        with self._lock:
+            if key in self._figures:
+                self._bytes -= self._figures.pop(key)[1]
+            self._figures[key] = (figure, size)
+            self._bytes += size
+            while self._figures and (len(self._figures) > self.max_entries or self._bytes > self.max_bytes):
+                _, (_, evicted_size) = self._figures.popitem(last=False)
+                self._bytes -= evicted_size
+                self._stats['evictions'] += 1
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], key + '.json')
+
+    def _read_disk(self, key):
+        if self.directory is None:
+            return None
+        path = self._path(key)
+        try:
+            with open(path, encoding='utf-8') as f:
+                text = f.read()
+        except OSError:
+            return None
+        # marks the figure as used, so pruning the folder keeps it over the figures that were not used for longer
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return text
+
+    def _write_disk(self, key, text):
+        if self.directory is None:
+            return
+        path = self._path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp = f'{path}.tmp-{os.getpid()}-{threading.get_ident()}'
+            with open(tmp, 'w', encoding='utf-8') as f:
+                f.write(text)
+            os.replace(tmp, path)
+        except OSError:
+            logger.exception('could not write figure %s to the disk cache', key)
+            return
+
+        # every so often the least recently used figures are removed to keep the folder within its size bound
+        self._writes += 1
+        if self._writes % 100 == 0:
+            self._prune_disk()
+
+    def _prune_disk(self):
+        files = []
+        for folder, _, names in os.walk(self.directory):
+            for name in names:
+                if name.endswith('.json'):
+                    path = os.path.join(folder, name)
+                    try:
+                        stat = os.stat(path)
+                    except OSError:
+                        continue
+                    files.append((stat.st_mtime, stat.st_size, path))
+
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total <= self.max_disk_bytes:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+
+    # the figures held in memory, from the least to the most recently used
+    def items(self):
+        with self._lock:
+            return [(key, figure) for key, (figure, _) in self._figures.items()]
+
+    def clear(self):
+        with self._lock:
+            self._figures.clear()
+            self._bytes = 0
+
+    def report(self):
+        with self._lock:
+            stats = dict(self._stats)
+            lookups = stats['hits'] + stats['disk_hits'] + stats['misses']
+            stats['hit_rate'] = (stats['hits'] + stats['disk_hits']) / lookups if lookups else 0.0
+            stats['entries'] = len(self._figures)
+            stats['bytes'] = self._bytes
+        return stats
@@ -0,0 +1,182 @@
+# A lightweight figure builder for the bar and radar charts of the tabs. Instead of building plotly graph objects (which
+# validates every property) and styling them with several update_layout calls, the figures are built as the plain
+# dictionaries plotly would produce for them. The styling shared by the charts is built once below, as well as the
+# default plotly template plotly adds to every figure. Dash accepts these dictionaries as figures directly. The builders
+# are timed as figure construction when the callbacks are instrumented (see instrumentation.py). The figures are made
+# compact before they are returned (rounded numbers and a trimmed template, see payload.py). Bump FIGURE_FORMAT_VERSION
+# in figure_cache.py when the output of a builder changes.
+
+from functools import lru_cache
+
+import plotly.express as px
+import plotly.graph_objs as go
+
+from viz_app.instrumentation import phase
+from viz_app.payload import compact_figure
+
+# the axis styling of the bar charts
+AXIS_STYLE = {'linecolor': 'darkgray', 'gridcolor': 'lightgray', 'linewidth': 1, 'showticklabels': True, 'ticks': ''}
+
+# the polar axis styling of the radar charts
+RADIAL_AXIS_STYLE = {'linecolor': 'darkgray', 'gridcolor': 'lightgray', 'linewidth': 1, 'showticklabels': False,
+                     'ticks': ''}
+ANGULAR_AXIS_STYLE = {'linecolor': 'darkgray', 'gridcolor': 'lightgray', 'linewidth': 1, 'showticklabels': True,
+                      'ticks': ''}
+
+LEGEND_STYLE = {'font': {'family': 'Arial'}}
+
+PALETTE = px.colors.qualitative.Plotly
+
+
+# the default template plotly adds to the layout of every figure, built once
+@lru_cache(maxsize=None)
+def template():
+    return go.Figure().to_plotly_json()['layout']['template']
+
+
+# converts numpy arrays and pandas objects to plain lists, the way plotly serializes them
+def to_list(values):
+    if hasattr(values, 'tolist'):
+        return values.tolist()
+    return list(values)
+
+
+def _title(text):
+    return {} if text is None else {'text': text}
+
+
+@phase('figure')
+def empty_figure(title=None):
+    layout = {'template': template()}
+    if title is not None:
+        layout['title'] = _title(title)
+    return {'data': [], 'layout': layout}
+
+
+# A bar chart with one bar per player, used for the leaderboard of the explore tab
+@phase('figure')
+def bar_chart(x, y, title, xaxis_title, yaxis_title, customdata=None, marker_color=None):
+    trace = {'type': 'bar', 'x': to_list(x), 'y': to_list(y)}
+    if customdata is not None:
+        trace['customdata'] = to_list(customdata)
+    if marker_color is not None:
+        trace['marker'] = {'color': to_list(marker_color)}
+    return compact_figure({'data': [trace], 'layout': _bar_layout(title, xaxis_title, yaxis_title)})
+
+
+# A grouped bar chart with one trace per player (names) and one group per feature (x), values holds one row per player
+@phase('figure')
+def grouped_bar_chart(names, x, values, title, xaxis_title, yaxis_title):
+    x = to_list(x)
+    traces = [{'type': 'bar', 'name': name, 'x': x, 'y': row} for name, row in zip(names, to_list(values))]
+    return compact_figure({'data': traces, 'layout': _bar_layout(title, xaxis_title, yaxis_title)})
+
+
+def _bar_layout(title, xaxis_title, yaxis_title):
+    return {
+        'template': template(),
+        'title': _title(title),
+        'legend': LEGEND_STYLE,
+        'xaxis': {**AXIS_STYLE, 'title': _title(xaxis_title)},
+        'yaxis': {**AXIS_STYLE, 'title': _title(yaxis_title)},
+    }
+
+
+# The bar chart of the search tab: the features of every player next to each other, the same figure plotly express
+# builds for px.bar(df, x='player', y=features, custom_data=['player'], barmode='group'). columns holds the values of
+# every feature, in the order of the players.
+@phase('figure')
+def feature_bar_chart(players, features, columns, title, colors):
+    players = to_list(players)
+    customdata = [[player] for player in players]
+    traces = []
+    for i, (feature, column) in enumerate(zip(features, columns)):
+        traces.append({
+            'alignmentgroup': 'True',
+            'customdata': customdata,
+            'hovertemplate': f'variable={feature}<br>player=%{{x}}<br>value=%{{y}}<extra></extra>',
+            'legendgroup': feature,
+            'marker': {'color': colors[i % len(colors)], 'pattern': {'shape': ''}},
+            'name': feature,
+            'offsetgroup': feature,
+            'orientation': 'v',
+            'showlegend': True,
+            'textposition': 'auto',
+            'type': 'bar',
+            'x': players,
+            'xaxis': 'x',
+            'y': to_list(column),
+            'yaxis': 'y',
+        })
+    layout = {
+        'template': template(),
+        'xaxis': {'anchor': 'y', 'domain': [0.0, 1.0], 'title': {'text': 'player'}},
+        'yaxis': {'anchor': 'x', 'domain': [0.0, 1.0], 'title': {'text': 'value'}},
+        'legend': {'title': {'text': 'variable'}, 'tracegroupgap': 0},
+        'title': _title(title),
+        'barmode': 'group',
+    }
+    return compact_figure({'data': traces, 'layout': layout})
+
+
+# The distribution of several features in one bar chart: every feature gets a trace with the number of players in each
+# bin of its own range. labels names the bins (shared by the features), ranges holds the low and high value of every
+# bin of every feature, shown when hovering.
+@phase('figure')
+def distribution_chart(features, labels, counts, ranges, title, colors):
+    labels = to_list(labels)
+    traces = []
+    for i, (feature, feature_counts, feature_ranges) in enumerate(zip(features, counts, ranges)):
+        traces.append({
+            'type': 'bar',
+            'name': feature,
+            'x': labels,
+            'y': to_list(feature_counts),
+            'customdata': to_list(feature_ranges),
+            'hovertemplate': f'{feature}: %{{customdata[0]:.4g}} to %{{customdata[1]:.4g}}<br>players=%{{y}}'
+                             '<extra></extra>',
+            'marker': {'color': colors[i % len(colors)]},
+        })
+    layout = {
+        **_bar_layout(title, 'share of the range of the feature', 'players'),
+        'barmode': 'group',
+    }
+    return compact_figure({'data': traces, 'layout': layout})
+
+
+# One radar trace per name, r holds one row of (scaled) values per name. hover_values holds the unscaled values shown
+# when hovering (left out when None). The arrays are converted to lists once for all traces, the traces share theta.
+@phase('figure')
+def radar_traces(names, r, theta, hover_values=None):
+    theta = to_list(theta)
+    rows = to_list(r)
+    hover_rows = [None] * len(rows) if hover_values is None else to_list(hover_values)
+    traces = []
+    for name, row, hover_row in zip(names, rows, hover_rows):
+        trace = {'type': 'scatterpolar', 'fill': 'toself', 'name': name, 'r': row, 'theta': theta}
+        if hover_row is not None:
+            trace['customdata'] = hover_row
+            trace['hovertemplate'] = '%{theta}: %{customdata}'
+        traces.append(trace)
+    return traces
+
+
+@phase('figure')
+def radar_chart(traces, title, radial_range):
+    layout = {
+        'template': template(),
+        'title': _title(title),
+        'showlegend': True,
+        'legend': LEGEND_STYLE,
+        'polar': {
+            'radialaxis': {'visible': True, 'range': list(radial_range), **RADIAL_AXIS_STYLE},
+            'angularaxis': ANGULAR_AXIS_STYLE,
+        },
+    }
+    return compact_figure({'data': list(traces), 'layout': layout})
+
+
+# colors for n bars, cycling through the plotly palette
+def palette_colors(n):
+    return [PALETTE[i % len(PALETTE)] for i in range(n)]
+
@@ -0,0 +1,209 @@
+# The indexes in this file are built once when a table is loaded (see load_player_table in data.py), so the callbacks
+# can look rows up directly instead of scanning the whole table on every interaction.
+
+import numpy as np
+import pandas as pd
+
+
+# Maps a player name to the row position(s) of that player within the table. Player names are not guaranteed to be
+# unique, in which case the first occurrence in the table is used, the same row df[df['player'] == name].iloc[0] gave.
+class PlayerIndex:
+
+    def __init__(self, names):
+        self._positions = {}
+        for position, name in enumerate(names):
+            self._positions.setdefault(name, []).append(position)
+
+    def __contains__(self, name):
+        return name in self._positions
+
+    def __len__(self):
+        return len(self._positions)
+
+    # the row position of the player, or None when the player is not in the table
+    def position(self, name):
+        positions = self._positions.get(name)
+        return positions[0] if positions else None
+
+    # all row positions of players sharing this name, in table order
+    def positions(self, name):
+        return list(self._positions.get(name, []))
+
+    # the row positions of the given players in the order they were given, together with the players that were not
+    # found in the table
+    def take(self, names):
+        positions = []
+        missing = []
+        for name in names:
+            position = self.position(name)
+            if position is None:
+                missing.append(name)
+            else:
+                positions.append(position)
+        return np.asarray(positions, dtype=np.intp), missing
+
+    # the row positions of every row of the given players in table order, the rows df['player'].isin(names) selects
+    def rows(self, names):
+        positions = [position for name in dict.fromkeys(names) for position in self._positions.get(name, [])]
+        return np.sort(np.asarray(positions, dtype=np.intp))
+
+
+# The values of the features at the given row positions as one 2-D float array (one row per position, one column per
+# feature). Every column is taken from its array directly, without building an intermediate frame of the rows.
+def take_values(df, positions, features):
+    values = np.empty((len(positions), len(features)), dtype=np.float64)
+    for i, feature in enumerate(features):
+        column = df[feature]
+        if isinstance(column.dtype, np.dtype):
+            values[:, i] = column.to_numpy()[positions]
+        else:
+            values[:, i] = column.iloc[positions].to_numpy(dtype=np.float64, na_value=np.nan)
+    return values
+
+
+# The selected players of a table, looked up once per interaction and shared by all charts built from them (e.g. the
+# radar and bar chart of the compare tab). players holds the selected players found in the table in the order they
+# were selected (every player once), missing the players that are not in the table. first_values() gives the first
+# row of every found player, the row the radar charts and the compare bar chart use.
+class PlayerSelection:
+
+    def __init__(self, table, players):
+        self._table = table
+        # a player selected twice is only shown once
+        players = list(dict.fromkeys(players or []))
+        self._first_positions, self.missing = table.players.take(players)
+        self.players = [player for player in players if player in table.players]
+
+    # the values of the first rows of the selected players as one 2-D float array, see take_values
+    def first_values(self, features):
+        return take_values(self._table.frame, self._first_positions, list(features))
+
+
+# Keeps the row positions of the table sorted by every feature, so the leaderboard of the explore tab is read by
+# walking the sorted order instead of sorting (a filtered copy of) the table on every interaction. Missing values are
+# left out of the order, in the same way nlargest leaves them out. Ties keep the order of the table.
+class RankingIndex:
+
+    def __init__(self, df, features):
+        self._descending = {}
+        self._ascending = {}
+        for feature in features:
+            values = df[feature].to_numpy(dtype=np.float64)
+            count = int(np.count_nonzero(~np.isnan(values)))
+            self._ascending[feature] = np.argsort(values, kind='stable')[:count]
+            self._descending[feature] = np.argsort(-values, kind='stable')[:count]
+
+    # The sorted orders as a flat dictionary of arrays, which the table cache stores next to the table (see
+    # build_ranking in data.py) so the orders are shared between processes instead of built and held by each of them
+    def arrays(self):
+        arrays = {}
+        for feature in self._descending:
+            arrays[f'asc:{feature}'] = self._ascending[feature]
+            arrays[f'desc:{feature}'] = self._descending[feature]
+        return arrays
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        ranking = cls.__new__(cls)
+        ranking._ascending = {}
+        ranking._descending = {}
+        for label, order in arrays.items():
+            direction, feature = label.split(':', 1)
+            (ranking._ascending if direction == 'asc' else ranking._descending)[feature] = order
+        return ranking
+
+    def __contains__(self, feature):
+        return feature in self._descending
+
+    # the row positions of all rows with a value for the feature, highest first (lowest first when ascending is set)
+    def order(self, feature, ascending=False):
+        return self._ascending[feature] if ascending else self._descending[feature]
+
+    # Returns the row positions of the (at most) n highest rows of the feature, or the lowest when ascending is set.
+    # where filters the rows, either as a boolean mask over all rows or as a function which receives an array of row
+    # positions and returns a boolean array telling which of them pass. The sorted order is walked in growing blocks
+    # until n rows passed, so a selective filter only looks at a small part of the table.
+    def top(self, feature, n, where=None, ascending=False):
+        order = self._ascending[feature] if ascending else self._descending[feature]
+        if where is None:
+            return order[:n]
+
+        found = []
+        count = 0
+        start = 0
+        block_size = max(4 * n, 64)
+        while start < len(order) and count < n:
+            rows = order[start:start + block_size]
+            rows = rows[where(rows)] if callable(where) else rows[where[rows]]
+            found.append(rows)
+            count += len(rows)
+            start += block_size
+            block_size *= 2
+
+        if not found:
+            return order[:0]
+        return np.concatenate(found)[:n]
+
+
+# the number of set bits in every possible byte, used to count the rows in a bitset
+_BIT_COUNTS = np.array([bin(i).count('1') for i in range(256)], dtype=np.int64)
+
+
+# Keeps a bitset (a packed array with one bit per row) for every position, team and age within the table. A filter
+# is answered by OR-ing the bitsets of the selected values within a facet and AND-ing the facets together, which is
+# a lot cheaper than building boolean masks from the columns on every call. The same bitsets give the number of
+# players for every value of a facet under the other filters, which the dropdowns show as live counts.
+class FacetIndex:
+
+    facets = ('position', 'team', 'age')
+
+    def __init__(self, df):
+        self.rows = len(df)
+        self._bits = {}
+        for facet in self.facets:
+            if facet not in df.columns:
+                continue
+            column = df[facet]
+            values = column.cat.categories if isinstance(column.dtype, pd.CategoricalDtype) else column.dropna().unique().tolist()
+            self._bits[facet] = {value: np.packbits((column == value).to_numpy()) for value in values}
+        self._all = np.packbits(np.ones(self.rows, dtype=bool))
+
+    def values(self, facet):
+        return list(self._bits.get(facet, {}))
+
+    # The bitset of the rows that pass the filters. Every filter left at None is ignored, an empty list of positions
+    # or teams is ignored as well, the same as an empty dropdown.
+    def select(self, positions=None, teams=None, age_range=None):
+        bits = self._all
+        if positions:
+            bits = bits & self._union('position', positions)
+        if teams:
+            bits = bits & self._union('team', teams)
+        if age_range is not None:
+            ages = [age for age in self._bits.get('age', {}) if age_range[0] <= age <= age_range[1]]
+            bits = bits & self._union('age', ages)
+        return bits
+
+    def _union(self, facet, values):
+        bits = np.zeros_like(self._all)
+        for value in values:
+            if value in self._bits.get(facet, {}):
+                bits = bits | self._bits[facet][value]
+        return bits
+
+    # converts a bitset to a boolean mask or to the row positions of the rows within it
+    def mask(self, bits):
+        return np.unpackbits(bits, count=self.rows).astype(bool)
+
+    def positions(self, bits):
+        return np.flatnonzero(self.mask(bits))
+
+    def count(self, bits):
+        return int(_BIT_COUNTS[bits].sum())
+
+    # The number of rows for every value of the facet, given the filters on the other facets (the filter on the facet
+    # itself is ignored, so every option shows how many players it would add)
+    def counts(self, facet, **filters):
+        filters.pop({'position': 'positions', 'team': 'teams', 'age': 'age_range'}[facet], None)
+        bits = self.select(**filters)
+        return {value: self.count(bits & value_bits) for value, value_bits in self._bits.get(facet, {}).items()}
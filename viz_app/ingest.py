@@ -0,0 +1,145 @@
+# Streaming ingestion of the csv files into the table cache. Instead of reading a whole csv file with one read_csv call,
+# the file is read in parts of ingest_chunk_rows rows (see config.py), so the memory needed to load a table is bounded
+# by the size of a part rather than by the size of the file:
+#   1. a first pass over the parts works out the schema of the table: the dtype every column gets, the same dtype
+#      normalize_table would give it when reading the whole file at once (e.g. the smallest integer type that holds
+#      every value, or the categories of a categorical column). Dtypes given in ingest_dtypes are used as they are.
+#   2. a second pass normalizes every part to that schema and appends it to the columns in the table cache.
+# Only the columns that are used are read (see ingest_columns), the excluded columns are never materialized.
+
+import numpy as np
+import pandas as pd
+
+from viz_app.cache import TableWriter
+from viz_app.config import categorical_columns, exclude_columns
+from viz_app.data import parse_age
+
+INTEGER_TYPES = [np.int8, np.int16, np.int32, np.int64]
+
+# float32 holds every integer up to this value exactly
+FLOAT32_EXACT_INTEGERS = 2 ** 24
+
+
+# the columns of the csv file that are read, every column except the excluded ones
+def ingest_columns(path):
+    header = pd.read_csv(path, nrows=0).columns
+    return [column for column in header if column not in exclude_columns]
+
+
+# What the first pass learns about a column over all parts
+class ColumnSummary:
+
+    def __init__(self):
+        self.kinds = set()
+        self.minimum = None
+        self.maximum = None
+        self.float32_exact = True
+        self.values = set()
+
+    def add(self, series, categorical):
+        if categorical:
+            self.values.update(series.dropna().unique().tolist())
+            return
+
+        if pd.api.types.is_bool_dtype(series):
+            self.kinds.add('bool')
+        elif pd.api.types.is_integer_dtype(series):
+            self.kinds.add('int')
+            if len(series):
+                self._range(series.min(), series.max())
+                if max(abs(int(series.min())), abs(int(series.max()))) > FLOAT32_EXACT_INTEGERS:
+                    self.float32_exact = False
+        elif pd.api.types.is_float_dtype(series):
+            self.kinds.add('float')
+            values = series.to_numpy(np.float64)
+            if not np.array_equal(values.astype(np.float32).astype(np.float64), values, equal_nan=True):
+                self.float32_exact = False
+        else:
+            self.kinds.add('string')
+
+    def _range(self, minimum, maximum):
+        self.minimum = minimum if self.minimum is None else min(self.minimum, minimum)
+        self.maximum = maximum if self.maximum is None else max(self.maximum, maximum)
+
+    # the description of the column within the table cache
+    def describe(self, name, categorical):
+        if categorical:
+            try:
+                categories = sorted(self.values)
+            except TypeError:
+                categories = list(self.values)
+            codes = pd.Categorical([], categories=categories).codes
+            return {'name': name, 'kind': 'category', 'dtype': codes.dtype.str, 'categories': categories,
+                    'ordered': False}
+
+        if not self.kinds or 'string' in self.kinds or ('bool' in self.kinds and len(self.kinds) > 1):
+            return {'name': name, 'kind': 'string'}
+        if self.kinds == {'bool'}:
+            return {'name': name, 'kind': 'numeric', 'dtype': np.dtype(np.bool_).str}
+        if 'float' in self.kinds:
+            dtype = np.float32 if self.float32_exact else np.float64
+            return {'name': name, 'kind': 'numeric', 'dtype': np.dtype(dtype).str}
+
+        # the smallest integer type holding every value, the type pd.to_numeric(downcast='integer') picks
+        minimum = 0 if self.minimum is None else self.minimum
+        maximum = 0 if self.maximum is None else self.maximum
+        for dtype in INTEGER_TYPES:
+            info = np.iinfo(dtype)
+            if info.min <= minimum and maximum <= info.max:
+                return {'name': name, 'kind': 'numeric', 'dtype': np.dtype(dtype).str}
+        return {'name': name, 'kind': 'numeric', 'dtype': np.dtype(np.int64).str}
+
+
+def _describe_override(name, dtype):
+    if dtype == 'category':
+        return None
+    if dtype in ('str', 'string', 'object'):
+        return {'name': name, 'kind': 'string'}
+    return {'name': name, 'kind': 'numeric', 'dtype': np.dtype(dtype).str}
+
+
+def _read_parts(path, usecols, chunk_rows, dtype=None):
+    return pd.read_csv(path, usecols=usecols, chunksize=chunk_rows, dtype=dtype)
+
+
+# The schema of the table within the csv file, a description (see describe_column in cache.py) of every column read.
+# dtypes holds the explicit dtypes of some columns, which are not inferred.
+def infer_schema(path, usecols, chunk_rows, dtypes=None):
+    dtypes = dtypes or {}
+    summaries = {column: ColumnSummary() for column in usecols}
+    for part in _read_parts(path, usecols, chunk_rows):
+        if 'age' in part.columns:
+            part['age'] = parse_age(part['age'])
+        for column in usecols:
+            if column in dtypes and dtypes[column] != 'category':
+                continue
+            summaries[column].add(part[column], column in categorical_columns or dtypes.get(column) == 'category')
+
+    schema = []
+    for column in usecols:
+        description = _describe_override(column, dtypes[column]) if column in dtypes else None
+        if description is None:
+            categorical = column in categorical_columns or dtypes.get(column) == 'category'
+            description = summaries[column].describe(column, categorical)
+        schema.append(description)
+    return schema
+
+
+# Reads the csv file at path in parts and writes it into the table cache under name. Every part is normalized to the
+# schema found by the first pass, so the cached table is the same as a normalized read of the whole file.
+def ingest_csv(name, path, source, chunk_rows, dtypes=None):
+    usecols = ingest_columns(path)
+    schema = infer_schema(path, usecols, chunk_rows, dtypes)
+    # the text columns are read as text, so a part that only holds numbers keeps them as they are written in the file
+    text_columns = {column['name']: str for column in schema if column['kind'] == 'string'}
+
+    writer = TableWriter(name, schema)
+    try:
+        for part in _read_parts(path, usecols, chunk_rows, dtype=text_columns):
+            if 'age' in part.columns:
+                part['age'] = parse_age(part['age'])
+            writer.append(part)
+        writer.commit(source)
+    except BaseException:
+        writer.abort()
+        raise
@@ -0,0 +1,384 @@
+# Opt-in instrumentation of the callbacks (see instrument_callbacks in config.py). Every request to the callback route
+# of dash is timed and attributed to the callback that handled it. Within a request the time is split into phases:
+#   data      -> getting the table from the registry and gathering its rows for a figure
+#   figure    -> building the figures (the builders of figures.py)
+#   cache     -> looking figures up in the figure cache
+#   serialize -> converting the figures and the callback output to json
+#   other     -> everything else, the logic of the callback itself and the dispatching of dash
+# together with the size of the request and the response. The size of the response is the size on the wire, when the
+# responses are compressed (see payload.py) the size before compression is recorded as well. The numbers are served at
+#   /metrics                -> all counters in the Prometheus text format
+#   /_debug/callbacks       -> a debug page with the latency of every callback over the most recent calls
+#   /_debug/profile         -> arms the profiler for the next (slow) call of a callback and lists the captured profiles
+# The phases are timed with timed() (or the phase decorator), which costs next to nothing when the app is not
+# instrumented, as no call is being recorded then.
+
+import cProfile
+import html
+import io
+import json
+import pstats
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from functools import wraps
+
+try:
+    from pyinstrument import Profiler as PyinstrumentProfiler
+except ImportError:
+    PyinstrumentProfiler = None
+
+PHASES = ('data', 'figure', 'cache', 'serialize', 'other')
+
+# the upper bounds (in seconds) of the buckets of the latency histogram
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# the call recorded by the current thread, None when nothing is recorded
+_local = threading.local()
+
+
+# A single request to the callback route. The phase times are exclusive: the time of a phase nested in another one
+# (e.g. building a figure while gathering the data for it) is only counted for the inner phase.
+class CallRecord:
+
+    def __init__(self):
+        self.callback = 'unknown'
+        self.start = time.time()
+        self.seconds = 0.0
+        self.phases = dict.fromkeys(PHASES, 0.0)
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.bytes_raw = 0
+        self.error = False
+        self._nested = []
+
+
+@contextmanager
+def timed(phase):
+    call = getattr(_local, 'call', None)
+    if call is None:
+        yield
+        return
+
+    call._nested.append(0.0)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        nested = call._nested.pop()
+        call.phases[phase] += elapsed - nested
+        if call._nested:
+            call._nested[-1] += elapsed
+
+
+# decorator version of timed, used for the figure builders
+def phase(name):
+    def decorate(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            if getattr(_local, 'call', None) is None:
+                return func(*args, **kwargs)
+            with timed(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+# The totals of one callback since the start of the process
+class CallbackMetrics:
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.seconds = 0.0
+        self.phases = dict.fromkeys(PHASES, 0.0)
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.bytes_raw = 0
+        self.buckets = [0] * len(LATENCY_BUCKETS)
+
+    def add(self, call):
+        self.calls += 1
+        self.errors += call.error
+        self.seconds += call.seconds
+        for name, seconds in call.phases.items():
+            self.phases[name] += seconds
+        self.bytes_in += call.bytes_in
+        self.bytes_out += call.bytes_out
+        self.bytes_raw += call.bytes_raw
+        for i, bound in enumerate(LATENCY_BUCKETS):
+            if call.seconds <= bound:
+                self.buckets[i] += 1
+
+
+class Instrumentation:
+
+    def __init__(self, recent_calls=500, kept_profiles=10):
+        self.metrics = {}
+        self.recent = deque(maxlen=recent_calls)
+        self.profiles = deque(maxlen=kept_profiles)
+        self._armed = None
+        self._profile_count = 0
+        self._names = {}
+        self._lock = threading.Lock()
+
+    # Wraps the callback route of the app and adds the metrics and debug routes to its server
+    def install(self, app):
+        self.app = app
+        prefix = app.config.routes_pathname_prefix
+        server = app.server
+        endpoint = prefix + '_dash-update-component'
+        server.view_functions[endpoint] = self._wrap_view(server.view_functions[endpoint])
+
+        server.add_url_rule(prefix + 'metrics', 'instrumentation_metrics', self.serve_metrics)
+        server.add_url_rule(prefix + '_debug/callbacks', 'instrumentation_callbacks', self.serve_panel)
+        server.add_url_rule(prefix + '_debug/profile', 'instrumentation_profiles', self.serve_profiles)
+        server.add_url_rule(prefix + '_debug/profile/<int:number>', 'instrumentation_profile', self.serve_profile)
+
+        # the callback output is serialized by dash itself, its json encoding is timed as well
+        import dash._callback
+        if hasattr(dash._callback, 'to_json'):
+            to_json = dash._callback.to_json
+
+            @wraps(to_json)
+            def timed_to_json(*args, **kwargs):
+                with timed('serialize'):
+                    return to_json(*args, **kwargs)
+
+            dash._callback.to_json = timed_to_json
+        return self
+
+    # the name of the callback handling a request (e.g. 'explore.update_explore_dropdown_and_chart'), from the output in
+    # the body of the request
+    def _callback_name(self, body):
+        output = body.get('output') if isinstance(body, dict) else None
+        if output not in self._names:
+            entry = self.app.callback_map.get(output)
+            if entry is None:
+                return 'unknown'
+            func = entry['callback']
+            module = getattr(func, '__module__', '') or ''
+            self._names[output] = f'{module.rsplit(".", 1)[-1]}.{getattr(func, "__name__", output)}'
+        return self._names[output]
+
+    def _wrap_view(self, view):
+        from flask import g, request
+
+        @wraps(view)
+        def instrumented_view(*args, **kwargs):
+            call = CallRecord()
+            call.callback = self._callback_name(request.get_json(silent=True))
+            call.bytes_in = request.content_length or 0
+            profiler = self._take_profiler(call.callback)
+
+            _local.call = call
+            start = time.perf_counter()
+            if profiler is not None:
+                profiler.start()
+            try:
+                response = view(*args, **kwargs)
+            except Exception:
+                call.error = True
+                raise
+            finally:
+                call.seconds = time.perf_counter() - start
+                if profiler is not None:
+                    profiler.stop()
+                _local.call = None
+                call.phases['other'] = max(0.0, call.seconds - sum(call.phases.values()))
+                if call.error:
+                    self._record(call, profiler)
+
+            call.error = getattr(response, 'status_code', 200) >= 500
+            if hasattr(response, 'get_data'):
+                call.bytes_out = response.content_length or len(response.get_data())
+            elif isinstance(response, (str, bytes)):
+                call.bytes_out = len(response)
+            call.bytes_raw = g.pop('uncompressed_bytes', call.bytes_out)
+            self._record(call, profiler)
+            return response
+
+        return instrumented_view
+
+    def _record(self, call, profiler):
+        with self._lock:
+            self.metrics.setdefault(call.callback, CallbackMetrics()).add(call)
+            self.recent.append(call)
+            if profiler is None:
+                return
+            # an armed profile is only kept when the call was slow enough, otherwise the next call is profiled
+            if call.seconds >= profiler.slower_than:
+                self._profile_count += 1
+                self.profiles.append({'number': self._profile_count,
+                                      'callback': call.callback, 'time': call.start, 'seconds': call.seconds,
+                                      'engine': profiler.engine, 'text': profiler.report()})
+                self._armed = None
+            elif self._armed is None:
+                self._armed = profiler.arm
+
+    # Arms the profiler for the next call of the callback (any callback when None) taking at least slower_than seconds
+    def arm(self, callback=None, slower_than=0.0, engine=None):
+        with self._lock:
+            self._armed = {'callback': callback, 'slower_than': slower_than, 'engine': engine}
+
+    def _take_profiler(self, callback):
+        with self._lock:
+            arm = self._armed
+            if arm is None or arm['callback'] not in (None, callback):
+                return None
+            self._armed = None
+        return RequestProfiler(arm)
+
+    # the metrics in the Prometheus text format
+    def prometheus(self):
+        lines = []
+
+        def metric(name, kind, text):
+            lines.append(f'# HELP {name} {text}')
+            lines.append(f'# TYPE {name} {kind}')
+
+        with self._lock:
+            metrics = sorted(self.metrics.items())
+
+            metric('dash_callback_calls_total', 'counter', 'Number of calls of the callback')
+            for name, m in metrics:
+                lines.append(f'dash_callback_calls_total{{callback="{name}"}} {m.calls}')
+            metric('dash_callback_errors_total', 'counter', 'Number of calls of the callback that failed')
+            for name, m in metrics:
+                lines.append(f'dash_callback_errors_total{{callback="{name}"}} {m.errors}')
+
+            metric('dash_callback_duration_seconds', 'histogram', 'Wall time of the requests to the callback')
+            for name, m in metrics:
+                for bound, count in zip(LATENCY_BUCKETS, m.buckets):
+                    lines.append(f'dash_callback_duration_seconds_bucket{{callback="{name}",le="{bound}"}} {count}')
+                lines.append(f'dash_callback_duration_seconds_bucket{{callback="{name}",le="+Inf"}} {m.calls}')
+                lines.append(f'dash_callback_duration_seconds_sum{{callback="{name}"}} {m.seconds:.6f}')
+                lines.append(f'dash_callback_duration_seconds_count{{callback="{name}"}} {m.calls}')
+
+            metric('dash_callback_phase_seconds_total', 'counter', 'Wall time of the callback spent per phase')
+            for name, m in metrics:
+                for phase_name, seconds in m.phases.items():
+                    lines.append(f'dash_callback_phase_seconds_total{{callback="{name}",phase="{phase_name}"}} '
+                                 f'{seconds:.6f}')
+
+            metric('dash_callback_request_bytes_total', 'counter', 'Size of the requests to the callback')
+            for name, m in metrics:
+                lines.append(f'dash_callback_request_bytes_total{{callback="{name}"}} {m.bytes_in}')
+            metric('dash_callback_response_bytes_total', 'counter', 'Size of the responses of the callback on the wire')
+            for name, m in metrics:
+                lines.append(f'dash_callback_response_bytes_total{{callback="{name}"}} {m.bytes_out}')
+            metric('dash_callback_response_uncompressed_bytes_total', 'counter',
+                   'Size of the responses of the callback before compression')
+            for name, m in metrics:
+                lines.append(f'dash_callback_response_uncompressed_bytes_total{{callback="{name}"}} {m.bytes_raw}')
+        return '\n'.join(lines) + '\n'
+
+    # the latency of every callback over the most recent calls
+    def summary(self):
+        with self._lock:
+            recent = list(self.recent)
+        calls = {}
+        for call in recent:
+            calls.setdefault(call.callback, []).append(call)
+
+        summary = {}
+        for name, records in sorted(calls.items()):
+            seconds = sorted(call.seconds for call in records)
+            summary[name] = {
+                'calls': len(records),
+                'p50_ms': seconds[len(seconds) // 2] * 1000,
+                'p95_ms': seconds[min(len(seconds) - 1, int(len(seconds) * 0.95))] * 1000,
+                'max_ms': seconds[-1] * 1000,
+                'phases_ms': {p: sum(call.phases[p] for call in records) / len(records) * 1000 for p in PHASES},
+                'bytes_in': sum(call.bytes_in for call in records) / len(records),
+                'bytes_out': sum(call.bytes_out for call in records) / len(records),
+                'bytes_raw': sum(call.bytes_raw for call in records) / len(records),
+            }
+        return summary
+
+    def serve_metrics(self):
+        return self.prometheus(), 200, {'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'}
+
+    def serve_panel(self):
+        from flask import request
+        summary = self.summary()
+        if request.args.get('format') == 'json':
+            return json.dumps(summary), 200, {'Content-Type': 'application/json'}
+
+        rows = []
+        for name, s in summary.items():
+            phases = ' '.join(f'{p} {ms:.1f}' for p, ms in s['phases_ms'].items())
+            rows.append(f'<tr><td>{html.escape(name)}</td><td>{s["calls"]}</td><td>{s["p50_ms"]:.1f}</td>'
+                        f'<td>{s["p95_ms"]:.1f}</td><td>{s["max_ms"]:.1f}</td><td>{phases}</td>'
+                        f'<td>{s["bytes_in"]:.0f}</td><td>{s["bytes_out"]:.0f}</td><td>{s["bytes_raw"]:.0f}</td></tr>')
+        with self._lock:
+            recent = list(self.recent)[-50:]
+        calls = [f'<tr><td>{time.strftime("%H:%M:%S", time.localtime(c.start))}</td><td>{html.escape(c.callback)}</td>'
+                 f'<td>{c.seconds * 1000:.1f}</td><td>{c.bytes_out}</td><td>{c.bytes_raw}</td>'
+                 f'<td>{"error" if c.error else ""}</td></tr>'
+                 for c in reversed(recent)]
+        return (
+            '<html><head><meta http-equiv="refresh" content="5"><title>Callbacks</title></head><body>'
+            f'<h2>Callbacks (last {len(self.recent)} calls)</h2>'
+            '<table border="1" cellpadding="4"><tr><th>callback</th><th>calls</th><th>p50 ms</th><th>p95 ms</th>'
+            '<th>max ms</th><th>mean ms per phase</th><th>mean bytes in</th><th>mean bytes out</th>'
+            '<th>mean bytes uncompressed</th></tr>'
+            + ''.join(rows) + '</table><h2>Most recent calls</h2><table border="1" cellpadding="4"><tr><th>time</th>'
+            '<th>callback</th><th>ms</th><th>bytes out</th><th>bytes uncompressed</th><th></th></tr>' + ''.join(calls)
+            + '</table>'
+            '<p><a href="profile">profiles</a></p></body></html>'
+        )
+
+    # /_debug/profile?callback=explore.update_explore_dropdown_and_chart&slower_than=0.2 arms the profiler, without
+    # arguments the captured profiles are listed
+    def serve_profiles(self):
+        from flask import request
+        if 'callback' in request.args or 'arm' in request.args:
+            self.arm(request.args.get('callback') or None, float(request.args.get('slower_than', 0.0)),
+                     request.args.get('engine'))
+        with self._lock:
+            armed = self._armed
+            profiles = list(self.profiles)
+        items = ''.join(f'<li><a href="profile/{p["number"]}">{html.escape(p["callback"])}</a> '
+                        f'{p["seconds"] * 1000:.1f} ms ({p["engine"]})</li>' for p in reversed(profiles))
+        state = f'armed: {html.escape(json.dumps(armed))}' if armed else 'not armed'
+        return f'<html><body><h2>Profiles</h2><p>{state}</p><ul>{items}</ul></body></html>'
+
+    def serve_profile(self, number):
+        with self._lock:
+            profile = next((p for p in self.profiles if p['number'] == number), None)
+        if profile is None:
+            return 'profile not found', 404
+        return profile['text'], 200, {'Content-Type': 'text/plain; charset=utf-8'}
+
+
+# Profiles a single request with pyinstrument when it is installed, with cProfile otherwise
+class RequestProfiler:
+
+    def __init__(self, arm):
+        self.arm = arm
+        self.slower_than = arm['slower_than']
+        engine = arm.get('engine') or ('pyinstrument' if PyinstrumentProfiler is not None else 'cprofile')
+        self.engine = 'pyinstrument' if engine == 'pyinstrument' and PyinstrumentProfiler is not None else 'cprofile'
+        self._profiler = PyinstrumentProfiler() if self.engine == 'pyinstrument' else cProfile.Profile()
+
+    def start(self):
+        if self.engine == 'pyinstrument':
+            self._profiler.start()
+        else:
+            self._profiler.enable()
+
+    def stop(self):
+        if self.engine == 'pyinstrument':
+            self._profiler.stop()
+        else:
+            self._profiler.disable()
+
+    def report(self):
+        if self.engine == 'pyinstrument':
+            return self._profiler.output_text(unicode=True)
+        text = io.StringIO()
+        pstats.Stats(self._profiler, stream=text).sort_stats('cumulative').print_stats(40)
+        return text.getvalue()
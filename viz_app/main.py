@@ -1,20 +1,69 @@
 # in this file, some variables get initiated (Such as the app)
-# The datasets are loaded into a dictionary to easily access the different dataframes using a function
-# called get_player_data, which uses some of the config.py 's defined variables.
+# The datasets are accessed through a registry which behaves like a dictionary, but only loads a table (using
+# load_table, which uses some of the config.py 's defined variables) the first time it is requested. Next to the player
+# tables the registry holds the combined table, all player tables joined into one (see combined.py).
 
 from dash import Dash
-from viz_app.data import get_player_data
-from viz_app.config import player_tables
+import pandas as pd
+from viz_app.data import team_tables
+from viz_app.combined import load_table
+from viz_app.config import player_tables, table_memory_budget, exclude_columns, figure_cache_size, \
+    figure_cache_bytes, figure_cache_path, figure_cache_disk_bytes, instrument_callbacks, precompute_workers, \
+    reload_interval, combined_table
+from viz_app.registry import TableRegistry
+from viz_app.background import manager as background_manager, install_table_loading
+from viz_app.figure_cache import FigureCache
+from viz_app.instrumentation import Instrumentation
+from viz_app.payload import install_compression, compress_assets
+from viz_app.precompute import LeaderboardPrecompute
+from viz_app.reload import DataWatcher
 
 
-# loading the app including the stylesheet included in the provided example app
-app = Dash(__name__, external_stylesheets=["https://use.fontawesome.com/releases/v5.7.2/css/all.css"])
+# With copy-on-write, column selections and filters of the shared tables are lazy views instead of copies. It is the
+# default behaviour from pandas 3.0 on, for pandas 2.x it has to be switched on. The registry relies on it to hand out
+# shallow copies of the shared tables (see registry.py), which is why pandas 2.0 or newer is required.
+if int(pd.__version__.split('.')[0]) == 2:
+    pd.set_option('mode.copy_on_write', True)
 
-# Create a dictionary for easier DataFrame access
-dataframes = {table: get_player_data(table) for table in player_tables}
+# loading the app including the stylesheet included in the provided example app. The responses of the callbacks are
+# compressed (see payload.py), the other responses when flask-compress is installed.
+app = Dash(__name__, external_stylesheets=["https://use.fontawesome.com/releases/v5.7.2/css/all.css"],
+           compress=compress_assets())
+install_compression(app)
 
-# Columns to exclude from radar chart
-exclude_columns = {'birth_year'}
+# Create a dictionary-like registry for easier DataFrame access, the tables are loaded lazily within a memory budget
+dataframes = TableRegistry([*player_tables, *([combined_table] if combined_table else [])], load_table,
+                           table_memory_budget)
+
+# The background callbacks run in processes forked from the worker (see background.py), which inherit the tables the
+# worker has loaded. The table a request selects is loaded before the call is forked, so a background call never loads
+# one itself.
+if background_manager is not None:
+    install_table_loading(app, dataframes)
+
+# The cache of built figures, keyed on the callback inputs and the version of the table (see figure_cache.py)
+figure_cache = FigureCache(figure_cache_size, figure_cache_bytes, figure_cache_path, figure_cache_disk_bytes)
+
+# The common leaderboards of the explore tab are precomputed into the disk tier of the figure cache, by the gunicorn
+# master before the workers start (see gunicorn.conf.py) or when the app runs on its own (see visualization_app.py)
+leaderboards = LeaderboardPrecompute(player_tables, figure_cache_path, precompute_workers)
+
+
+# Changed data files are reloaded in the background and swapped into the registry, the leaderboards of a reloaded table
+# are precomputed again and the columns of the table within the combined table are joined again. This runs within the
+# reload lock of the table, so the leaderboards are only built by the first worker that reloads it.
+def table_changed(name):
+    leaderboards.refresh(name)
+    if combined_table in dataframes.loaded():
+        dataframes.reload(combined_table)
+
+
+watcher = DataWatcher(dataframes, player_tables, team_tables(), reload_interval, on_change=table_changed)
+app.server.before_request(watcher.start_once)
+
+# The opt-in instrumentation of the callbacks, None when it is switched off. It is installed after the compression, so
+# it records the compressed size of the responses next to their size before compression.
+instrumentation = Instrumentation().install(app) if instrument_callbacks else None
 
 # Title of the window
 app.title = "Football Visualization"
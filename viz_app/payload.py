@@ -0,0 +1,148 @@
+# Keeps the responses of the callbacks small, most of the time a scout on slow Wi-Fi waits for a chart is spent on the
+# bytes on the wire. The figures are made compact when they are built (see figures.py):
+#   precision    -> the numbers of the traces are rounded to figure_decimals decimals, which is far more than a chart
+#                   can show but takes away the long tails of the float64 values in the json text
+#   typed arrays -> the numeric arrays of the traces are sent as base64 encoded binary ({'dtype': 'f4', 'bdata': ...})
+#                   instead of json numbers. plotly.js decodes these from version 2.28 on, so they are only used when
+#                   the plotly.js bundled with the installed plotly (the one dcc.Graph uses) is new enough.
+#   template     -> the default template holds the trace defaults of every plotly trace type, only those of the trace
+#                   types within the figure are kept
+# and the responses of the callback route are compressed with brotli (when the brotli package is installed and the
+# browser accepts it) or gzip. With compress_responses, the other files the server sends (e.g. the javascript bundles)
+# are compressed as well when the optional flask-compress package is installed. Bump FIGURE_FORMAT_VERSION in
+# figure_cache.py when the compaction of the figures changes.
+
+import base64
+import gzip
+import importlib.util
+from functools import wraps
+
+import numpy as np
+from plotly.offline import get_plotlyjs_version
+
+from viz_app.config import figure_decimals, figure_typed_arrays, compress_responses, compress_min_bytes, \
+    compress_level
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# the keys of a trace that can hold numeric arrays
+NUMERIC_KEYS = ('x', 'y', 'r', 'customdata')
+
+
+# plotly.js decodes typed arrays from version 2.28 on
+def typed_arrays_supported():
+    major, minor = (int(part) for part in get_plotlyjs_version().split('.')[:2])
+    return (major, minor) >= (2, 28)
+
+
+TYPED_ARRAYS = figure_typed_arrays and typed_arrays_supported()
+
+
+# Rounds the numeric arrays of the traces, encodes them as typed arrays when supported and trims the template of the
+# layout. The figure is changed in place and returned.
+def compact_figure(figure, decimals=figure_decimals, typed_arrays=TYPED_ARRAYS):
+    types = set()
+    for trace in figure['data']:
+        types.add(trace.get('type', 'scatter'))
+        for key in NUMERIC_KEYS:
+            values = _numeric(trace.get(key))
+            if values is None:
+                continue
+            if typed_arrays and values.ndim == 1:
+                trace[key] = encode_array(values if decimals is None else np.round(values, decimals), decimals)
+            elif decimals is not None and values.dtype.kind == 'f':
+                trace[key] = np.round(values, decimals).tolist()
+
+    # an empty figure keeps the whole template, its layout may be used for traces added later on
+    template = figure['layout'].get('template')
+    if types and isinstance(template, dict) and 'data' in template:
+        figure['layout']['template'] = {**template, 'data': {t: template['data'][t] for t in types
+                                                              if t in template['data']}}
+    return figure
+
+
+# Rounds the numbers in a (nested) list, e.g. data that a clientside callback turns into traces
+def round_values(values, decimals=figure_decimals):
+    array = _numeric(values)
+    if array is None or decimals is None or array.dtype.kind != 'f':
+        return values
+    return np.round(array, decimals).tolist()
+
+
+# The values as a typed array of plotly.js: whole numbers as int32, other numbers as float32 when that keeps them
+# within the rounding or 7 significant digits (otherwise as float64)
+def encode_array(values, decimals=figure_decimals):
+    values = values.astype(np.float64, copy=False)
+    finite = values[np.isfinite(values)]
+    if len(finite) == len(values) and np.array_equal(finite, np.round(finite)) \
+            and (len(finite) == 0 or np.abs(finite).max() < 2 ** 31):
+        array = values.astype('<i4')
+    else:
+        single = values.astype('<f4')
+        tolerance = 0.5 * 10.0 ** -decimals if decimals is not None else 0.0
+        close = np.abs(single[np.isfinite(values)] - finite) <= np.maximum(tolerance, np.abs(finite) * 1e-7)
+        array = single if close.all() else values.astype('<f8')
+    dtype = array.dtype.kind + str(array.dtype.itemsize)
+    return {'dtype': dtype, 'bdata': base64.b64encode(array.tobytes()).decode('ascii')}
+
+
+# The values as an array when they are a (nested) list of numbers only, None otherwise. Missing values (None, e.g. in a
+# figure read back from json) become NaN.
+def _numeric(values):
+    if not isinstance(values, list) or not values:
+        return None
+    try:
+        array = np.asarray(values)
+    except ValueError:
+        # a ragged list
+        return None
+    if array.dtype.kind == 'O' and all(value is None or isinstance(value, (int, float)) and not isinstance(value, bool)
+                                       for value in array.ravel()):
+        return array.astype(np.float64)
+    return array if array.dtype.kind in 'iuf' else None
+
+
+# whether dash should compress the other responses of the server, which it does through flask-compress
+def compress_assets():
+    return compress_responses and importlib.util.find_spec('flask_compress') is not None
+
+
+# Compresses the responses of the callback route. The compression wraps the view of the route, so the instrumentation
+# (installed after it) sees the compressed size of a response, the size before compression is left in
+# flask.g.uncompressed_bytes.
+def install_compression(app):
+    if not compress_responses:
+        return app
+    server = app.server
+    endpoint = app.config.routes_pathname_prefix + '_dash-update-component'
+    server.view_functions[endpoint] = compress_view(server.view_functions[endpoint])
+    return app
+
+
+def compress_view(view, min_bytes=compress_min_bytes, level=compress_level):
+    from flask import g, request
+
+    @wraps(view)
+    def compressed_view(*args, **kwargs):
+        response = view(*args, **kwargs)
+        if not hasattr(response, 'get_data') or response.direct_passthrough or 'Content-Encoding' in response.headers:
+            return response
+        data = response.get_data()
+        g.uncompressed_bytes = len(data)
+        response.vary.add('Accept-Encoding')
+        if len(data) < min_bytes or response.status_code != 200:
+            return response
+
+        accepted = request.accept_encodings
+        if brotli is not None and accepted['br']:
+            response.set_data(brotli.compress(data, quality=min(11, level)))
+            response.headers['Content-Encoding'] = 'br'
+        elif accepted['gzip']:
+            response.set_data(gzip.compress(data, compresslevel=level))
+            response.headers['Content-Encoding'] = 'gzip'
+        return response
+
+    return compressed_view
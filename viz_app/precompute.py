@@ -0,0 +1,142 @@
+# The leaderboards of the explore tab form a small space: every table, every feature and a handful of common filters
+# (see the precompute_ settings in config.py). Those leaderboards are built by a pool of worker processes and written
+# to the disk tier of the figure cache (figure_cache_path) under the same keys the callback uses, so every app worker
+# serves them from there and only builds the uncommon combinations itself. The leaderboards already on disk (for the
+# same table version) are not built again, a marker file in the precomputed folder of the disk tier records the table
+# versions that are done. There are far more leaderboards than the memory tier of a worker holds, so they are only kept
+# on disk; without a disk tier they would not be shared, and nothing is precomputed.
+#   run()     -> builds the leaderboards of every table and waits for them, once by the gunicorn master before the
+#                workers start (see gunicorn.conf.py)
+#   start()   -> builds the leaderboards in the background, when the app runs on its own (see visualization_app.py)
+#   refresh() -> builds the leaderboards of a table whose data changed, within the process and the reload lock of the
+#                worker that rebuilt the table (see reload.py). The other workers wait for that lock and then find the
+#                version marked as done, so no worker starts a pool of its own and the work is done once.
+
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from viz_app.cache import file_lock
+from viz_app.config import precompute_positions, precompute_age_ranges, precompute_orders
+from viz_app.figure_cache import FigureCache
+
+logger = logging.getLogger(__name__)
+
+
+# the filters (feature, age range, positions, ascending) of the leaderboards of a table that are precomputed
+def leaderboard_filters(table):
+    for feature in table.schema.display_features:
+        if feature not in table.ranking:
+            continue
+        for positions in precompute_positions:
+            for age_range in precompute_age_ranges:
+                for order in precompute_orders:
+                    yield feature, list(age_range), positions, order == 'asc'
+
+
+def _marker_path(directory, name, version):
+    return os.path.join(directory, 'precomputed', f'{name}-{version}')
+
+
+# Loads the table and writes all its common leaderboards to the disk cache in directory, unless that was done for this
+# version of the table already. Returns the number of leaderboards built and the table version.
+def precompute_table(name, directory):
+    from viz_app.data import load_player_table
+    from viz_app.tabs.explore import cached_leaderboard
+
+    with file_lock(f'precompute-{name}'):
+        table = load_player_table(name)
+        marker = _marker_path(directory, name, table.version)
+        if os.path.exists(marker):
+            return 0, table.version
+
+        # the figures are only written to disk, the memory of the worker does not have to hold them
+        cache = FigureCache(max_entries=0, directory=directory)
+        count = 0
+        for feature, age_range, positions, ascending in leaderboard_filters(table):
+            cached_leaderboard(cache, table, name, feature, age_range, positions, ascending)
+            count += 1
+
+        os.makedirs(os.path.dirname(marker), exist_ok=True)
+        open(marker, 'w').close()
+    return count, table.version
+
+
+class LeaderboardPrecompute:
+
+    def __init__(self, tables, directory, workers):
+        self.tables = list(tables)
+        self.directory = directory
+        self.workers = workers
+        self._executor = None
+        self._lock = threading.Lock()
+        self._stats = {'tables': 0, 'leaderboards': 0, 'errors': 0, 'seconds': 0.0, 'versions': {}}
+
+    # whether anything is precomputed: it needs workers and a disk tier
+    @property
+    def enabled(self):
+        return bool(self.workers) and self.directory is not None
+
+    # Precomputes the leaderboards of the given tables (all tables when None) and waits until they are written
+    def run(self, tables=None):
+        if not self.enabled:
+            return
+        with ProcessPoolExecutor(max_workers=self.workers) as executor:
+            futures = self._submit(executor, tables)
+        for name, start, future in futures:
+            self._done(name, start, future)
+
+    # Precomputes the leaderboards of the given tables (all tables when None) in the background
+    def start(self, tables=None):
+        if not self.enabled:
+            return
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(max_workers=self.workers)
+            executor = self._executor
+        for name, start, future in self._submit(executor, tables):
+            future.add_done_callback(lambda future, name=name, start=start: self._done(name, start, future))
+
+    # Precomputes the leaderboards of a table whose data changed within this process and waits for them, meant to be
+    # called within the reload lock of the table (see table_changed in main.py)
+    def refresh(self, name):
+        if not self.enabled:
+            return
+        start = time.perf_counter()
+        try:
+            count, version = precompute_table(name, self.directory)
+        except Exception:
+            logger.exception('could not precompute the leaderboards of %s', name)
+            with self._lock:
+                self._stats['errors'] += 1
+            return
+        self._record(name, start, count, version)
+
+    def _submit(self, executor, tables):
+        return [(name, time.perf_counter(), executor.submit(precompute_table, name, self.directory))
+                for name in (self.tables if tables is None else tables)]
+
+    def _done(self, name, start, future):
+        try:
+            count, version = future.result()
+        except Exception:
+            logger.exception('could not precompute the leaderboards of %s', name)
+            with self._lock:
+                self._stats['errors'] += 1
+            return
+        self._record(name, start, count, version)
+
+    def _record(self, name, start, count, version):
+        with self._lock:
+            self._stats['tables'] += 1
+            self._stats['leaderboards'] += count
+            self._stats['seconds'] += time.perf_counter() - start
+            self._stats['versions'][name] = version
+
+    def report(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['versions'] = dict(stats['versions'])
+        return stats
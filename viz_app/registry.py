@@ -0,0 +1,134 @@
+# The table registry replaces the plain dictionary of dataframes. It behaves like a read only dictionary keyed on the
+# table names, but a table is only loaded the first time a callback asks for it. The loaded tables are kept under a
+# memory budget: when the budget is exceeded the least recently used tables are dropped and loaded again on demand.
+# The loader returns a PlayerTable (see data.py), indexing the registry gives its dataframe while table() gives the
+# whole PlayerTable including the schema.
+# The callbacks get a shallow copy of the shared frame. With copy-on-write (switched on in main.py) the copy shares the
+# column arrays without copying them, while any change a callback makes to it (setting a column or a cell) copies the
+# changed data first, so the shared table itself is never changed.
+
+import dataclasses
+import threading
+from collections import OrderedDict
+from collections.abc import Mapping
+
+from viz_app.instrumentation import timed
+
+
+def frame_bytes(df):
+    return int(df.memory_usage(index=True, deep=True).sum())
+
+
+class TableRegistry(Mapping):
+
+    def __init__(self, names, loader, memory_budget=None):
+        self._names = list(names)
+        self._loader = loader
+        self.memory_budget = memory_budget
+        self._tables = OrderedDict()
+        self._sizes = {}
+        self._lock = threading.Lock()
+        # one lock per table, so two callbacks asking for the same table at once only load it once
+        self._load_locks = {name: threading.Lock() for name in self._names}
+
+    # Mapping interface, so dataframes[selected_stat] keeps working in the tabs
+    def __getitem__(self, name):
+        return self.table(name).frame
+
+    def table(self, name):
+        with timed('data'):
+            table = self._table(name)
+            return dataclasses.replace(table, frame=table.frame.copy(deep=False))
+
+    def _table(self, name):
+        if name not in self._load_locks:
+            raise KeyError(name)
+
+        with self._lock:
+            if name in self._tables:
+                self._tables.move_to_end(name)
+                return self._tables[name]
+
+        with self._load_locks[name]:
+            # another thread might have loaded the table while we were waiting for the lock
+            with self._lock:
+                if name in self._tables:
+                    self._tables.move_to_end(name)
+                    return self._tables[name]
+
+            table = self._loader(name)
+            self._store(name, table)
+            return table
+
+    def __iter__(self):
+        return iter(self._names)
+
+    def __len__(self):
+        return len(self._names)
+
+    def __contains__(self, name):
+        return name in self._load_locks
+
+    def _store(self, name, table):
+        with self._lock:
+            self._tables[name] = table
+            self._tables.move_to_end(name)
+            self._sizes[name] = frame_bytes(table.frame)
+            self._evict(keep=name)
+
+    # drops the least recently used tables until the loaded tables fit the budget again. The table that was just
+    # requested is always kept, even when it exceeds the budget by itself.
+    def _evict(self, keep):
+        if self.memory_budget is None:
+            return
+        while sum(self._sizes.values()) > self.memory_budget and len(self._tables) > 1:
+            name = next(iter(self._tables))
+            if name == keep:
+                self._tables.move_to_end(name)
+                continue
+            del self._tables[name]
+            del self._sizes[name]
+
+    # puts an already prepared table in the registry, replacing the one that was loaded before. New names are added to
+    # the registry as well (the benchmarks use this to install synthetic tables).
+    def install(self, name, table):
+        with self._lock:
+            if name not in self._load_locks:
+                self._names.append(name)
+                self._load_locks[name] = threading.Lock()
+        self._store(name, table)
+
+    # Loads the table again (e.g. when its data changed) and swaps it in once it is completely built. Callbacks asking for
+    # the table meanwhile get the previous one, a table is never seen half loaded.
+    def reload(self, name):
+        if name not in self._load_locks:
+            raise KeyError(name)
+        with self._load_locks[name]:
+            table = self._loader(name)
+            self._store(name, table)
+        return table
+
+    def loaded(self):
+        with self._lock:
+            return list(self._tables)
+
+    def evict(self, name):
+        with self._lock:
+            self._tables.pop(name, None)
+            self._sizes.pop(name, None)
+
+    # the resident bytes of every loaded table, tables that are not loaded are left out
+    def resident_bytes(self):
+        with self._lock:
+            return dict(self._sizes)
+
+    # The bytes of every loaded table split into the bytes shared with the other workers (memory mapped from the table
+    # cache) and the bytes private to this worker. With the table cache, the private bytes stay small however many
+    # workers run.
+    def memory_report(self):
+        with self._lock:
+            tables = dict(self._tables)
+        report = {name: table.memory() for name, table in tables.items()}
+        report['total'] = {key: sum(memory[key] for memory in report.values())
+                           for key in ('shared_bytes', 'private_bytes')}
+        return report
@@ -0,0 +1,121 @@
+# Watches the csv files of the player and team data folders, so refreshed data is picked up without restarting the app.
+# A background thread checks the files every few seconds. A file counts as changed once its mtime or size differs from
+# what was seen before and has stayed the same for one more check (so a file that is still being written is not read).
+# Only the affected table is then read and normalized again, in the background:
+#   player table, loaded   -> the new PlayerTable is built completely and then swapped into the registry in one go.
+#                             Callbacks keep using the table they already got, callbacks after the swap get the new one.
+#                             As the version of the table changes with its contents, the cached figures of the old
+#                             table are not used anymore.
+#   player table, unloaded -> only the binary table cache is rebuilt, so the next load is fast again
+#   team table             -> only the binary table cache is rebuilt, team tables are not kept in memory
+# Every worker of a server runs its own watcher and sees the change at about the same time. The reload holds a lock file
+# of the table (see file_lock in cache.py), so the first worker rebuilds the table cache while the others wait for it
+# and then only memory map the rebuilt cache.
+
+import logging
+import os
+import threading
+import time
+
+from viz_app.cache import file_lock
+from viz_app.data import player_data_path, team_data_path, get_player_data, get_team_data
+
+logger = logging.getLogger(__name__)
+
+
+def _file_state(path):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+class DataWatcher:
+
+    # on_change(name) is called after a player table was reloaded, e.g. to precompute its leaderboards again
+    def __init__(self, registry, player_tables, team_tables=(), interval=5.0, on_change=None):
+        self.registry = registry
+        self.interval = interval
+        self.on_change = on_change
+        self._files = {('player', name): player_data_path(name) for name in player_tables}
+        self._files.update({('team', name): team_data_path(name) for name in team_tables})
+        self._seen = {key: _file_state(path) for key, path in self._files.items()}
+        self._pending = {}
+        self._thread = None
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._stats = {'checks': 0, 'reloads': 0, 'errors': 0, 'events': []}
+
+    # starts the watcher thread, only the first time it is called
+    def start_once(self):
+        with self._lock:
+            if self._thread is not None or not self.interval:
+                return
+            self._thread = threading.Thread(target=self._run, name='data-watcher', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.check()
+            except Exception:
+                logger.exception('checking the data files failed')
+
+    # checks all files once and reloads the tables whose file changed, returns the reloaded tables
+    def check(self):
+        reloaded = []
+        for key, path in self._files.items():
+            state = _file_state(path)
+            if state is None or state == self._seen[key]:
+                self._pending.pop(key, None)
+                continue
+            # the file changed, it is only read once it stayed the same for a whole interval
+            if self._pending.get(key) != state:
+                self._pending[key] = state
+                continue
+
+            if self.reload(*key):
+                self._seen[key] = state
+                del self._pending[key]
+                reloaded.append(key)
+        with self._lock:
+            self._stats['checks'] += 1
+        return reloaded
+
+    # Reads and normalizes the table again, returns whether that succeeded. The tables derived from it are rebuilt by
+    # on_change within the same lock, so the other workers find those up to date as well.
+    def reload(self, kind, name):
+        start = time.perf_counter()
+        with file_lock(f'reload-{kind}-{name}'):
+            try:
+                if kind == 'team':
+                    get_team_data(name)
+                elif name in self.registry.loaded():
+                    self.registry.reload(name)
+                else:
+                    get_player_data(name)
+            except Exception:
+                # e.g. a file that is only partly written, it is tried again on the next check
+                logger.exception('could not reload the %s table %s', kind, name)
+                with self._lock:
+                    self._stats['errors'] += 1
+                return False
+
+            with self._lock:
+                self._stats['reloads'] += 1
+                self._stats['events'] = (self._stats['events'] + [
+                    {'table': f'{kind}/{name}', 'time': time.time(), 'seconds': time.perf_counter() - start}])[-50:]
+            logger.info('reloaded the %s table %s', kind, name)
+            if kind == 'player' and self.on_change is not None:
+                self.on_change(name)
+        return True
+
+    def report(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['events'] = list(stats['events'])
+        return stats
@@ -0,0 +1,188 @@
+# Finds the players most like a given player, over the features the user picked. The numeric features of a table are
+# standardized once when the table is loaded (every feature minus its mean, divided by its standard deviation) and kept
+# as one contiguous float32 matrix with a row per table row. Missing values become 0, the mean of the feature. A query
+# compares the rows of the query players with every row of the table in one matrix product:
+#   cosine    -> the cosine similarity of the standardized rows, higher is more alike
+#   euclidean -> the euclidean distance between the standardized rows, lower is more alike
+# Many query players at once are compared block by block (block_rows table rows times block_queries query players), so
+# the matrix of scores held in memory stays small however many players are queried. The squared norms of the rows over
+# all features are computed once with the index. A query over some of the features zeroes the other features of the
+# query players instead of copying those columns of the table, only the norms are then computed per block.
+
+import numpy as np
+
+METRICS = ('cosine', 'euclidean')
+
+
+class SimilarityIndex:
+
+    def __init__(self, matrix, features, players, names):
+        self.matrix = matrix
+        self.features = list(features)
+        self._columns = {feature: i for i, feature in enumerate(self.features)}
+        self._players = players
+        self._names = names
+        self._norms = np.einsum('ij,ij->i', matrix, matrix)
+        self._inverse_norms = _inverse_norms(self._norms)
+
+    # standardizes the features of the frame with the column statistics of the table (see stats.py)
+    @classmethod
+    def build(cls, df, features, stats, players):
+        features = list(features)
+        matrix = np.empty((len(df), len(features)), dtype=np.float32)
+        mean = stats.mean[features].to_numpy(dtype=np.float64)
+        std = stats.std[features].to_numpy(dtype=np.float64)
+        # features without any spread carry no information, they are all 0 after subtracting the mean
+        std = np.where(np.isfinite(std) & (std > 0), std, 1)
+        for i, feature in enumerate(features):
+            values = (df[feature].to_numpy(dtype=np.float64, na_value=np.nan) - mean[i]) / std[i]
+            matrix[:, i] = np.nan_to_num(values, nan=0.0)
+        return cls(matrix, features, players, df['player'].to_numpy())
+
+    def __contains__(self, feature):
+        return feature in self._columns
+
+    # Returns the k players most like every one of the given players over the features (all features when None or
+    # when none of them is known), as a dictionary from each query player to a list of (player, score) pairs, the most
+    # alike first. Players that are not in the table are left out. The query players themselves and the players in
+    # exclude are never returned, neither is the same player twice.
+    def neighbours(self, players, features=None, k=10, metric='cosine', exclude=(), block_rows=65536,
+                   block_queries=64):
+        if metric not in METRICS:
+            raise ValueError(f'unknown metric {metric}, expected one of {METRICS}')
+
+        players = list(dict.fromkeys(players))
+        positions, _ = self._players.take(players)
+        players = [player for player in players if player in self._players]
+        columns = [self._columns[feature] for feature in features or [] if feature in self._columns]
+        if not players or k < 1:
+            return {player: [] for player in players}
+
+        # the features left out of the query count for nothing, in the query players and in the norms of the table rows
+        weights = None
+        queries = self.matrix[positions]
+        if columns and len(columns) < len(self.features):
+            weights = np.zeros(len(self.features), dtype=np.float32)
+            weights[columns] = 1
+            queries *= weights
+        excluded = set(players) | set(exclude)
+
+        # the rows of a player name can appear several times (e.g. a player with two clubs), so a few more rows than k
+        # are taken and the list is widened when too many of them are excluded or repeated
+        count = k + len(excluded) + 8
+        while True:
+            rows, scores = self._top(queries, weights, count, metric, block_rows, block_queries)
+            result = {}
+            complete = True
+            for player, player_rows, player_scores in zip(players, rows, scores):
+                result[player] = _distinct(self._names[player_rows], player_scores, excluded, k)
+                complete = complete and len(result[player]) == k
+            if complete or count >= len(self.matrix):
+                return result
+            count = min(len(self.matrix), count * 4)
+
+    # the row positions and scores of the count best rows of every query, best first. weights holds 1 for the features
+    # of the query and 0 for the others, None when all features are queried.
+    def _top(self, queries, weights, count, metric, block_rows, block_queries):
+        table = self.matrix
+        count = min(count, len(table))
+        rows = np.empty((len(queries), count), dtype=np.intp)
+        scores = np.empty((len(queries), count), dtype=np.float32)
+
+        for start in range(0, len(queries), block_queries):
+            block = queries[start:start + block_queries]
+            best_rows = []
+            best_scores = []
+
+            # the best rows of every block of table rows, merged below
+            for first in range(0, len(table), block_rows):
+                part = table[first:first + block_rows]
+                if weights is None:
+                    part_norms = self._norms[first:first + block_rows]
+                    part_inverse = self._inverse_norms[first:first + block_rows]
+                else:
+                    part_norms = np.square(part) @ weights
+                    part_inverse = _inverse_norms(part_norms)
+                part_scores = _scores(part, part_inverse if metric == 'cosine' else part_norms, block, metric)
+                part_rows = _best(part_scores, count)
+                best_scores.append(np.take_along_axis(part_scores, part_rows, axis=1))
+                best_rows.append(part_rows + first)
+
+            best_scores = np.concatenate(best_scores, axis=1)
+            best_rows = np.concatenate(best_rows, axis=1)
+            keep = _best(best_scores, count)
+            best_scores = np.take_along_axis(best_scores, keep, axis=1)
+            best_rows = np.take_along_axis(best_rows, keep, axis=1)
+
+            order = np.argsort(-best_scores, axis=1, kind='stable')
+            rows[start:start + len(block)] = np.take_along_axis(best_rows, order, axis=1)
+            scores[start:start + len(block)] = np.take_along_axis(best_scores, order, axis=1)
+
+        # the part of the scores that is the same for all rows of a query is only added to the best scores
+        query_norms = np.einsum('ij,ij->i', queries, queries)
+        if metric == 'cosine':
+            # a row at the mean of every feature has no direction, as a query nothing is alike
+            with np.errstate(divide='ignore', invalid='ignore'):
+                scores /= np.sqrt(query_norms)[:, None]
+            scores[query_norms == 0] = -np.inf
+        else:
+            scores = np.sqrt(np.maximum(query_norms[:, None] - scores, 0))
+        return rows, scores
+
+
+# The positions of the count highest scores of every row (in no particular order). A full argpartition of every row is
+# the slow part of a query, so the rows are narrowed down first: the count-th highest score of an evenly spaced sample
+# of the columns is never above the count-th highest score of all columns, so only the columns scoring at least that
+# much can be among the best. Those few candidates are partitioned per row.
+def _best(scores, count, sample_factor=32):
+    n = scores.shape[1]
+    if n <= count:
+        return np.broadcast_to(np.arange(n), scores.shape)
+    step = n // (count * sample_factor)
+    if step < 2:
+        return np.argpartition(scores, n - count, axis=1)[:, -count:]
+
+    sample = scores[:, ::step]
+    thresholds = np.partition(sample, sample.shape[1] - count, axis=1)[:, -count]
+    best = np.empty((len(scores), count), dtype=np.intp)
+    for i, (row, threshold) in enumerate(zip(scores, thresholds)):
+        candidates = np.flatnonzero(row >= threshold)
+        if len(candidates) > count:
+            candidates = candidates[np.argpartition(row[candidates], len(candidates) - count)[-count:]]
+        best[i] = candidates
+    return best
+
+
+# The scores of every query (rows) against every table row (columns) that order the rows of a query, higher is more
+# alike. part_values holds the inverse norms of the rows for the cosine and their squared norms for the euclidean
+# metric. The scores leave out what is the same for every row of a query (see _top):
+#   cosine    -> q.x / |x|, the cosine similarity times the norm of the query
+#   euclidean -> 2 q.x - |x|^2, the negated squared distance |q|^2 - 2 q.x + |x|^2 without the |q|^2
+def _scores(part, part_values, queries, metric):
+    products = queries @ part.T
+    if metric == 'cosine':
+        products *= part_values[None, :]
+        return products
+    products *= 2
+    products -= part_values[None, :]
+    return products
+
+
+# 1 / |x| of every row, a row at the mean of every feature has no direction and scores 0 for the cosine
+def _inverse_norms(norms):
+    with np.errstate(divide='ignore'):
+        return np.where(norms > 0, 1 / np.sqrt(norms), 0).astype(np.float32)
+
+
+# the first k distinct players of the best rows, leaving out the excluded players
+def _distinct(names, scores, excluded, k):
+    result = []
+    seen = set(excluded)
+    for name, score in zip(names, scores):
+        if name in seen or not np.isfinite(score):
+            continue
+        seen.add(name)
+        result.append((name, float(score)))
+        if len(result) == k:
+            break
+    return result
@@ -0,0 +1,44 @@
+# Column statistics of a table, computed once when the table is loaded (see load_player_table in data.py). As they are
+# part of the loaded PlayerTable, they are thrown away and computed again whenever the table is (re)loaded.
+# The radar charts use them to scale the few selected players instead of scaling the whole table on every call.
+
+import numpy as np
+import pandas as pd
+
+PERCENTILES = (5, 25, 50, 75, 95)
+
+
+class ColumnStats:
+
+    def __init__(self, df, columns):
+        values = df[list(columns)].astype('float64')
+        self.columns = list(columns)
+        self.minimum = values.min()
+        self.maximum = values.max()
+        self.mean = values.mean()
+        self.std = values.std()
+        # one row per percentile (e.g. stats.percentiles.loc[50] holds the medians)
+        self.percentiles = values.quantile([p / 100 for p in PERCENTILES])
+        self.percentiles.index = list(PERCENTILES)
+
+    # a frame with one column per statistic, handy for debugging and for a quick overview of a table
+    def summary(self):
+        summary = pd.DataFrame({'min': self.minimum, 'max': self.maximum, 'mean': self.mean, 'std': self.std})
+        for p in PERCENTILES:
+            summary[f'p{p}'] = self.percentiles.loc[p]
+        return summary
+
+    # Scales the values (one row per player, one column per feature) to the 0-1 domain using the minimum and maximum of
+    # every feature. Features without any spread become NaN, the same as the division by zero gave before.
+    def min_max_scale(self, values, features):
+        minimum = self.minimum[features].to_numpy()
+        value_range = self.maximum[features].to_numpy() - minimum
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return (np.asarray(values, dtype=np.float64) - minimum) / value_range
+
+    # Scales the values by the maximum of every feature, so each radar axis runs from 0 to that feature's maximum.
+    # Features with a maximum of 0 or lower are left unscaled.
+    def max_scale(self, values, features):
+        maximum = self.maximum[features].to_numpy()
+        maximum = np.where(maximum > 0, maximum, 1)
+        return np.asarray(values, dtype=np.float64) / maximum
@@ -0,0 +1,71 @@
+# Synthetic player tables for the benchmarks. A base table (the real table when the data is available, otherwise a
+# generated one with the same structure) is scaled to any number of rows by repeating its rows with some noise on the
+# numeric features. The repeated players get a numbered name, so the player names stay unique.
+
+import numpy as np
+import pandas as pd
+
+from viz_app.config import player_tables
+from viz_app.data import get_player_data, normalize_table
+
+POSITIONS = ['GK', 'DF', 'MF', 'FW', 'DF,MF', 'MF,FW']
+TEAMS = ['Argentina', 'Australia', 'Brazil', 'Cameroon', 'Canada', 'Costa Rica', 'Croatia', 'Denmark', 'Ecuador',
+         'England', 'France', 'Germany', 'Ghana', 'Iran', 'Japan', 'Korea Republic', 'Mexico', 'Morocco', 'Netherlands',
+         'Poland', 'Portugal', 'Qatar', 'Saudi Arabia', 'Senegal', 'Serbia', 'Spain', 'Switzerland', 'Tunisia',
+         'United States', 'Uruguay', 'Wales', 'Belgium']
+
+
+# a table with the structure of the player tables, with random players and features
+def generate_table(table, rows=680, features=12, seed=0):
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({
+        'player': [f'Player {i}' for i in range(rows)],
+        'position': rng.choice(POSITIONS, rows),
+        'team': rng.choice(TEAMS, rows),
+        'age': [f'{age}-{days:03d}' for age, days in zip(rng.integers(17, 39, rows), rng.integers(0, 365, rows))],
+        'club': rng.choice([f'Club {i}' for i in range(300)], rows),
+        'birth_year': rng.integers(1983, 2006, rows),
+    })
+    for i in range(features):
+        name = f'{table.replace("player_", "")}_{i}'
+        df[name] = rng.integers(0, 60, rows) if i % 2 == 0 else np.round(rng.gamma(2.0, 3.0, rows), 2)
+    return normalize_table(df)
+
+
+# the real table when its csv file can be read, otherwise a generated one
+def base_table(table, seed=0):
+    try:
+        return get_player_data(table)
+    except OSError:
+        return generate_table(table, seed=seed)
+
+
+# Repeats the rows of the (normalized) table factor times. Every copy gets noise on the numeric features and a numbered
+# player name, the first copy is the table itself.
+def scale_table(df, factor, seed=0):
+    rng = np.random.default_rng(seed)
+    rows = len(df)
+    scaled = df.iloc[np.tile(np.arange(rows), factor)].reset_index(drop=True)
+    # the scaled table does not come from the table cache anymore, so nothing derived from it may be stored there
+    scaled.attrs.clear()
+    copy = np.repeat(np.arange(factor), rows)
+
+    names = scaled['player'].astype(str).to_numpy()
+    scaled['player'] = [name if number == 0 else f'{name} #{number}' for name, number in zip(names, copy)]
+
+    for column in scaled.columns:
+        if column in ('age', 'birth_year') or not pd.api.types.is_numeric_dtype(scaled[column]) \
+                or pd.api.types.is_bool_dtype(scaled[column]):
+            continue
+        values = scaled[column].to_numpy(dtype=np.float64)
+        noise = np.where(copy == 0, 1.0, rng.uniform(0.8, 1.2, len(values)))
+        if pd.api.types.is_integer_dtype(scaled[column]):
+            scaled[column] = np.round(values * noise).astype(np.int64)
+        else:
+            scaled[column] = np.round(values * noise, 2)
+    return normalize_table(scaled)
+
+
+# all player tables, scaled by factor
+def synthetic_tables(factor, seed=0):
+    return {table: scale_table(base_table(table, seed), factor, seed) for table in player_tables}
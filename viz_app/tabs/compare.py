@@ -1,11 +1,13 @@
 # The imports here consist of basic dash functionality, some plotting as well as custom functions
+from functools import cache
+
 from dash import callback, Input, Output, dcc, html, Dash, State
-import plotly.graph_objs as go
-import plotly.express as px
 
-from viz_app.main import dataframes, exclude_columns
-from viz_app.config import player_tables
-import pandas as pd
+from viz_app.main import dataframes, figure_cache
+from viz_app import figures
+from viz_app.background import heavy_callback, debounce
+from viz_app.indexes import PlayerSelection
+from viz_app.config import player_tables, combined_table
 
 # The compare view consists of multiple rows which contain 2 columns of width 6 (6/12)
 # The first row contains the selects for dataset and feature and the second row contains the output using 2 graphs
@@ -16,7 +18,7 @@ layout = dcc.Tab(label='Compare Players', children=[
             html.Label('Select Stat Category'),
             dcc.Dropdown(
                 id='compare-stats-dropdown',
-                options=[{'label': stat, 'value': stat} for stat in player_tables],
+                options=[{'label': stat, 'value': stat} for stat in player_tables + [combined_table] if stat],
                 style={'width': '100%'},
                 value='player_defense'
             ),
@@ -32,6 +34,11 @@ layout = dcc.Tab(label='Compare Players', children=[
         ], className='six columns'),
     ], className='row', style={'marginBottom': '10px'}),
 
+    # The player selection is passed on to the charts once it stopped changing (see debounce in background.py), the
+    # status shows when the charts are being updated
+    dcc.Store(id='compare-players-debounced'),
+    html.Div(id='compare-status', style={'min-height': '20px'}),
+
     html.Div([
         html.Div([
             dcc.Graph(id='compare-players-chart', clickData=None),
@@ -44,129 +51,88 @@ layout = dcc.Tab(label='Compare Players', children=[
 ])
 
 
-# Our first callback updates the radar chart hwen either dataset changes, features changes, or player selection changes
-@callback(
-    Output('compare-radar-chart', 'figure'),
-    Input('selected-players', 'value'),
-    Input('compare-stats-dropdown', 'value'),
-    Input('compare-feature-dropdown', 'value'))
-def update_compare_radar_chart(players, selected_stat, selected_features):
-    # Is no dataset is selected for whatever reason, return an empty figure
-    if selected_stat is None:
-        return go.Figure()
-
-    # Copy the original dataframe to keep the original clean
-    df = dataframes[selected_stat].copy()
-
-    # Let's exclude some default columns that are not interesting within a radar
-    features = df.columns.difference([*exclude_columns, 'club', 'position', 'age', 'player', 'team'])
-
-    # if no features are selected, set the selected features to all features
-    if selected_features is None:
-        selected_features = features
-
-    # this bit of code checks whether the values are valid, ignoring any invalid values. If the remaining number of
-    # features is 0, we revert back to all features of the dataset
-    selected_features = [x for x in selected_features if x in features]
-    if len(selected_features) < 1:
-        selected_features = features
-
-    # In this bit we prepare an empty list to start adding the radar data, as well as making sure all numeric features
-    # are scaled for the user to have a pleasant visual experience. As this is the compare tab, we do not care too much
-    # for specific values, thus the conversion in the 0-1 domain.
-
-    radar_data = []
-    numerics = ['int16', 'int32', 'int64', 'float16', 'float32', 'float64']
-    numerics = df.select_dtypes(include=numerics).columns
-    df[numerics] = (df[numerics]-df[numerics].min())/(df[numerics].max()-df[numerics].min())
-
+debounce('selected-players', 'value', 'compare-players-debounced')
 
-    # for each player, we check if such a player exists. We then take the first occurence and append their data to the
-    # radar plot data
-    for player in players:
-        players_data = df[df['player'] == player]
-        if players_data.shape[0] < 1:
-            break
-        player_data = players_data.iloc[0]
 
-
-        radar_data.append(
-            go.Scatterpolar(
-                r=player_data[selected_features],
-                theta=selected_features,
-                fill='toself',
-                name=player
-            )
-        )
-
-    # straight forward definition of the layout. As we scaled the data, we can set the range from 0-1
-    layout = go.Layout(
-        title=f'Radar chart of selected players',
-        polar=dict(radialaxis=dict(visible=True, range=[0, 1])),
-        showlegend=True
-    )
-
-    # returning a full composition of the figure. As plotly is quite robust, non numerical columns that slip through
-    # are seemingly ignored.
-    return go.Figure(data=radar_data, layout=layout).update_layout(legend=dict(font=dict(family='Arial')), polar=dict(
-        radialaxis=dict(linecolor='darkgray', gridcolor='lightgray', linewidth=1, showticklabels=False, ticks=''),
-        angularaxis=dict(linecolor='darkgray', gridcolor='lightgray', linewidth=1, showticklabels=True, ticks='')))
-
-
-# The next callback follows a lot of similar logic. We check for existing variables and filter for numerical columns
-# We give the barchart some names and add the players one for one to the graph to get the correct grouping
+# Our first callback updates both charts when either dataset changes, features changes, or player selection changes.
+# The radar chart and the bar chart show the same players, so the rows of the selected players are gathered from the
+# table once and shared by both charts (and only when one of them is not in the figure cache yet). It runs in the
+# background when available (see background.py), a newer change cancels the call that is still running.
 @callback(
+    Output('compare-radar-chart', 'figure'),
     Output('compare-players-chart', 'figure'),
     Input('compare-stats-dropdown', 'value'),
     Input('compare-feature-dropdown', 'value'),
-    Input('selected-players', 'value'))
-def update_compare_feature_dropdown_and_chart(selected_stat, selected_features, players):
+    Input('compare-players-debounced', 'data'),
+    **heavy_callback(running=[(Output('compare-status', 'children'), 'Updating the charts...', '')],
+                     cancel=[Input('tabs-select', 'value')]))
+def update_compare_charts(selected_stat, selected_features, players):
+    # Is no dataset is selected for whatever reason, return empty figures
     if selected_stat is None:
-        return go.Figure(), []
+        return figures.empty_figure(), figures.empty_figure()
 
-    if players is None:
-        return go.Figure(), []
+    # The shared dataframe is only read, never modified
+    table = dataframes.table(selected_stat)
+    players = players or []
+
+    # The radar features exclude some default columns that are not interesting within a radar, the bar chart shows all
+    # numeric features. The selected features that are not valid are ignored, if no (valid) features are selected we
+    # revert back to all features of the dataset
+    radar_features = valid_features(selected_features, table.schema.radar_features)
+    bar_features = valid_features(selected_features, table.schema.numeric_features)
+
+    @cache
+    def selection():
+        return PlayerSelection(table, players)
+
+    # the figures are taken from the figure cache when this combination of players and features was seen before
+    params = [selected_stat, radar_features, players]
+    radar_chart = figure_cache.cached_figure('compare-radar', table.version, params,
+                                             lambda: build_compare_radar_chart(table, radar_features, selection()))
 
     if len(players) < 1:
-        return go.Figure(), []
+        return radar_chart, figures.empty_figure()
+
+    params = [selected_stat, bar_features, players]
+    bar_chart = figure_cache.cached_figure('compare-bar', table.version, params,
+                                           lambda: build_compare_bar_chart(selected_stat, bar_features, selection()))
+    return radar_chart, bar_chart
 
-    df = dataframes[selected_stat].copy()
-    numerics = ['int16', 'int32', 'int64', 'float16', 'float32', 'float64']
-    features = list(df.select_dtypes(include=numerics).columns)
 
+def valid_features(selected_features, features):
     if selected_features is None:
-        selected_features = features
-    else:
-        selected_features = [x for x in selected_features if x in features]
-        if len(selected_features) < 1:
-            selected_features = features
+        return list(features)
+    selected_features = [x for x in selected_features if x in features]
+    return selected_features if selected_features else list(features)
+
 
+def build_compare_radar_chart(table, selected_features, selection):
+    # The players' data is scaled using the minimum and maximum of every feature (computed once when the table is
+    # loaded) for the user to have a pleasant visual experience. As this is the compare tab, we do not care too much for
+    # specific values, thus the conversion in the 0-1 domain. Only the rows of the selected players get scaled, the
+    # shared frame stays untouched.
 
+    # For each player, we take their first row in the table (the selection holds the first occurrence of every name),
+    # all players at once into one array which is scaled in one go. Players that do not exist in this table are skipped.
+    values = selection.first_values(selected_features)
+    radar_data = figures.radar_traces(selection.players, table.stats.min_max_scale(values, selected_features),
+                                      selected_features)
 
+    # straight forward definition of the layout. As we scaled the data, we can set the range from 0-1
+    return figures.radar_chart(radar_data, 'Radar chart of selected players', [0, 1])
 
-    # Create the bar chart using Plotly Graph Objects
-    bar_data = df[df['player'].isin(players)].sort_values(by='player', ascending=False)
-    bar_data = bar_data[selected_features]
 
-    fig = go.Figure()
-    for i, player in enumerate(players):
-        fig.add_trace(
-            go.Bar(
-                x=selected_features,
-                y=bar_data.iloc[i],
-                name=player
-            )
-        )
-    # updating the layout title
-    fig.update_layout(title=f'Players performance in the selected features within {selected_stat}', xaxis_title='Player',
-                      yaxis_title=None)
-    # updating the layout with legend, as well as returning the resulting figure
-    return fig.update_layout(legend=dict(font=dict(family='Arial')),
-                             xaxis=dict(linecolor='darkgray', gridcolor='lightgray', linewidth=1,
-                                        showticklabels=True, ticks=''),
-                             yaxis=dict(linecolor='darkgray', gridcolor='lightgray', linewidth=1,
-                                        showticklabels=True, ticks=''))
+# The bar chart follows a lot of similar logic. Every player gets one trace, grouped per feature. The values of the
+# players are gathered through the player index in the order the players were selected, so every trace is labelled
+# with the player its values belong to. Selected players that are not in this table are named in the title.
+def build_compare_bar_chart(selected_stat, selected_features, selection):
+    values = selection.first_values(selected_features)
 
+    # all traces together with the title and the layout of the axes
+    title = f'Players performance in the selected features within {selected_stat}'
+    if selection.missing:
+        title += ' (not found: {})'.format(', '.join(selection.missing))
+    return figures.grouped_bar_chart(selection.players, selected_features, values, title, 'Player', None)
 
 
 # This callback updates the features dropdown, with some check for when no stat is selected. It excludes some features.
@@ -178,8 +144,7 @@ def update_compare_stat_and_feature_dropdown(selected_stat):
     if selected_stat is None:
         selected_stat = 'player_defense'
 
-    df = dataframes[selected_stat].copy()
-    features = df.columns.difference([*exclude_columns, 'team', 'club'])
+    features = dataframes.table(selected_stat).schema.display_features
     feature_options = [{'label': feature, 'value': feature} for feature in features]
 
     return feature_options, features
\ No newline at end of file
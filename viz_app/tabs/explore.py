@@ -1,12 +1,12 @@
-# standard dash imports, plotly imports, pandas, as well as some custom functions and variables
+# standard dash imports, the figure builder, numpy, as well as some custom functions and variables
 
-from dash import callback, Input, Output, dcc, html, Dash, State
-import plotly.graph_objs as go
-import plotly.express as px
-
-from viz_app.main import dataframes, exclude_columns
-from viz_app.config import player_tables
-import pandas as pd
+from dash import callback, clientside_callback, Input, Output, dcc, html, Dash, State
+from viz_app.main import dataframes, figure_cache
+from viz_app import figures
+from viz_app.background import debounce
+from viz_app.indexes import take_values
+from viz_app.payload import round_values
+from viz_app.config import player_tables, leaderboard_size
 
 # Here we define the tab. It consists of a few rows, of which the first 2 contain the input elements.
 layout = dcc.Tab(label='Explore Players', children=[
@@ -39,7 +39,8 @@ layout = dcc.Tab(label='Explore Players', children=[
                 min=15,
                 max=40,
                 value=[15, 40],
-                marks={i: f'{i}' for i in range(15, 41, 5)}
+                marks={i: f'{i}' for i in range(15, 41, 5)},
+                updatemode='drag'
             ),
         ], className='six columns'),
 
@@ -54,7 +55,29 @@ layout = dcc.Tab(label='Explore Players', children=[
         ], className='six columns'),
     ], className='row', style={'marginBottom': '10px'}),
 
-    # The output row, which contains the bar chart with top players as well as the hover data radar chart
+    html.Div([
+        html.Div([
+            html.Label('Show'),
+            dcc.RadioItems(
+                id='leaderboard-order',
+                options=[{'label': 'Highest', 'value': 'desc'}, {'label': 'Lowest', 'value': 'asc'}],
+                value='desc',
+                inline=True
+            ),
+        ], className='six columns'),
+    ], className='row', style={'marginBottom': '10px'}),
+
+    # The output row, which contains the bar chart with top players as well as the hover data radar chart. The radar
+    # chart is drawn in the browser from the stores: the scaled radar values of the players in the leaderboard (sent
+    # along with the bar chart) and the layout of the radar chart, which never changes.
+    # The age range and positions while dragging the slider or picking positions are passed on to the callbacks through
+    # these stores once they stopped changing (see debounce in background.py). The status shows when the leaderboard is
+    # being updated.
+    dcc.Store(id='age-range-debounced', data=[15, 40]),
+    dcc.Store(id='position-debounced'),
+    html.Div(id='explore-status', style={'min-height': '20px'}),
+    dcc.Store(id='explore-radar-data'),
+    dcc.Store(id='explore-radar-layout', data=figures.radar_chart([], None, [0, 1])['layout']),
     html.Div([
         html.Div([
             dcc.Graph(id='top-players-chart', clickData=None),
@@ -85,118 +108,151 @@ def add_to_selection(clickData, players):
         players.append(player)
     return players
 
-# The radar plot update based on hover
+# The position options show how many players of each position fall within the selected age range, using the counts
+# of the facet index
 @callback(
+    Output('position-dropdown', 'options'),
+    Input('explore-stats-dropdown', 'value'),
+    Input('age-range-debounced', 'data'))
+def update_position_counts(selected_stat, age_range):
+    positions = ['GK', 'DF', 'MF', 'FW']
+    if selected_stat is None:
+        return [{'label': pos, 'value': pos} for pos in positions]
+
+    counts = dataframes.table(selected_stat).facets.counts('position', age_range=age_range)
+    return [{'label': f'{pos} ({counts.get(pos, 0)})', 'value': pos} for pos in positions]
+
+# The radar plot update based on hover. Hovering over the leaderboard happens a lot more than anything else, so the
+# radar chart is drawn by the browser itself instead of asking the server for every hover event. The players that can
+# be hovered are the players in the leaderboard, whose (scaled) radar values were sent along with the bar chart in the
+# order of the leaderboard. They are looked up by the position of the hovered bar, as two players may share a name.
+clientside_callback(
+    """
+    function(hoverData, radarData, radarLayout) {
+        var traces = [];
+        var title = 'Hover over a player to view';
+        if (hoverData && radarData) {
+            hoverData.points.forEach(function(point) {
+                var row = radarData.players[point.pointIndex];
+                if (!row) {
+                    return;
+                }
+                var player = row.player;
+                traces.push({type: 'scatterpolar', fill: 'toself', name: player, r: row.r,
+                             theta: radarData.features, customdata: row.values, hovertemplate: '%{theta}: %{customdata}'});
+                title = 'Radar plot with features of ' + player;
+            });
+        }
+        if (traces.length === 0) {
+            return {data: [], layout: {template: radarLayout.template, title: {text: title}}};
+        }
+        return {data: traces, layout: Object.assign({}, radarLayout, {title: {text: title}})};
+    }
+    """,
     Output('explore-radar-chart', 'figure'),
     Input('top-players-chart', 'hoverData'),
-    State('explore-stats-dropdown', 'value'))
-def update_explore_radar_chart(hoverData, selected_stat):
-    # Initiate a title if no hover data is found and return empty figure
-    title = 'Hover over a player to view'
-    if hoverData is None or selected_stat is None:
-        layout_empty = go.Layout(title=title)
-        return go.Figure(layout=layout_empty)
-
-    # retrieve the player
-    selected_players = [point['customdata'][0] for point in hoverData['points']]
-
-
-    # copy clean frame
-    df = dataframes[selected_stat].copy()
-    radar_data = []
-
-    # cycle through players and add their data to the radar plot. The code assumes multiple players but in practice
-    # only 1 player is hovered and processed
-    for player in selected_players:
-        player_data = df[df['player'] == player].iloc[0]
-        features = df.columns.difference([*exclude_columns, 'club', 'position', 'age', 'player', 'team'])
-        radar_data.append(
-            go.Scatterpolar(
-                r=player_data[features],
-                theta=features,
-                fill='toself',
-                name=player
-            )
-        )
-        title = f'Radar plot with features of {player}'
-
-    # setting the layout. Note the double use of max().max() to get the maximum of the dataset to scale the radar plot
-    # to. It is somewhat problematic, as it scales features to the maximum of all variables. A workaround is possible
-    # but not without a proper refactor to guarantee the speed and optimization of the app
-    layout = go.Layout(
-        title=title,
-        polar=dict(radialaxis=dict(visible=True, range=[0, max(df[features].max().max(), 1)])),
-        showlegend=True
-    )
-
-    # here we return the figure
-    return go.Figure(data=radar_data, layout=layout).update_layout(legend=dict(font=dict(family='Arial')), polar=dict(
-        radialaxis=dict(linecolor='darkgray', gridcolor='lightgray', linewidth=1, showticklabels=False, ticks=''),
-        angularaxis=dict(linecolor='darkgray', gridcolor='lightgray', linewidth=1, showticklabels=True, ticks='')))
+    State('explore-radar-data', 'data'),
+    State('explore-radar-layout', 'data'))
+
+
+# The radar values of the players at the given rows (the rows of the leaderboard), in the order of the leaderboard.
+# Every feature is scaled by its own maximum (taken from the column statistics computed when the table was loaded), so
+# each axis of the radar runs from 0 to the maximum of that feature. The real values are shown when hovering. The
+# numbers are rounded like the numbers of the figures (see payload.py).
+def build_radar_data(table, rows):
+    features = table.schema.radar_features
+    values = take_values(table.frame, rows, features)
+    scaled = table.stats.max_scale(values, features)
+    players = table.frame['player'].iloc[rows]
+    return {
+        'features': list(features),
+        'players': [{'player': player, 'r': r, 'values': row}
+                    for player, r, row in zip(players, round_values(scaled.tolist()), round_values(values.tolist()))],
+    }
+
+debounce('age-range-slider', 'value', 'age-range-debounced')
+debounce('position-dropdown', 'value', 'position-debounced')
+
 
 # this is a big callback which updates both the feature dropdown as well as the bar chart containing top players within
-# the feature selected
+# the feature selected. The leaderboard is answered by the ranking index or the figure cache within milliseconds, so it
+# runs as a normal callback rather than in the background (see background.py).
 @callback(
     Output('top-players-chart', 'figure'),
     Output('explore-feature-dropdown', 'options'),
+    Output('explore-radar-data', 'data'),
     Input('explore-stats-dropdown', 'value'),
     Input('explore-feature-dropdown', 'value'),
-    Input('age-range-slider', 'value'),
-    Input('position-dropdown', 'value'))
-def update_explore_dropdown_and_chart(selected_stat, selected_feature, age_range, positions):
+    Input('age-range-debounced', 'data'),
+    Input('position-debounced', 'data'),
+    Input('leaderboard-order', 'value'),
+    running=[(Output('explore-status', 'children'), 'Updating the leaderboard...', '')])
+def update_explore_dropdown_and_chart(selected_stat, selected_feature, age_range, positions, order='desc'):
     # check for selected dataset
     if selected_stat is None:
-        return go.Figure(), []
-
-    # getting a clean dataframe copy, as well as cleaning up some of the columns and sanitizing age dynamically.
-    # Ideally this would be moved in the application start up in a refactor.
-    df = dataframes[selected_stat].copy()
-    df['age'] = df['age'].apply(lambda x: x[:2])
-    df['age'] = pd.to_numeric(df['age'])
-    features = df.columns.difference([*exclude_columns, 'team', 'club'])
+        return figures.empty_figure(), [], None
+
+    # getting the shared (read only) table. The age is already sanitized when the table is loaded (see
+    # normalize_table in data.py) and the feature list comes from the table schema.
+    table = dataframes.table(selected_stat)
+    features = table.schema.display_features
     feature_options = [{'label': feature, 'value': feature} for feature in features]
 
-    # If no feature is selected that is valid, we return the first feature
-    if selected_feature not in features:
-        selected_feature = features[0]
-
-    # if age_range is set, we filter by age
-    if age_range is not None:
-        # Filter by age
-        df = df[(df['age'] >= age_range[0]) & (df['age'] <= age_range[1])]
-
-    # if positions is set, we filter by position
-    if positions is not None:
-        # Filter by position
-        if positions:
-            df = df[df['position'].isin(positions)]
-
-    # Selecting the top players in the stat
-    top_players = df.nlargest(10, selected_feature).sort_values(by=selected_feature, ascending=False)
-
-    # Generating some colors, we only need 10 as we only select the top 10 players
-    bar_colors = px.colors.qualitative.Plotly[:10]
-
-    # instantiate empty figure
-    fig = go.Figure()
-
-    # adding the player_data in one go
-    fig.add_trace(
-        go.Bar(
-            x=top_players['player'],
-            y=top_players[selected_feature],
-            customdata=top_players[['player']].values,
-            marker_color=bar_colors
-        )
-    )
-
-    # updating the layout title
-    fig.update_layout(title=f'Top 10 Players in {selected_feature}', xaxis_title='Player',
-                      yaxis_title=selected_feature)
-
-    # adding some figure layouting and returning the options for the features as well (feature_options)
-    return fig.update_layout(legend=dict(font=dict(family='Arial')),
-                             xaxis=dict(linecolor='darkgray', gridcolor='lightgray', linewidth=1,
-                                        showticklabels=True, ticks=''),
-                             yaxis=dict(linecolor='darkgray', gridcolor='lightgray', linewidth=1,
-                                        showticklabels=True, ticks='')), feature_options
+    # If no feature is selected that is valid (or it cannot be ranked, like the player names), we return the first
+    # feature that can. A table without any feature that can be ranked gets an empty chart.
+    ranking = table.ranking
+    if selected_feature not in features or selected_feature not in ranking:
+        selected_feature = next((feature for feature in features if feature in ranking), None)
+    if selected_feature is None:
+        return figures.empty_figure(), feature_options, None
+
+    # The chart is taken from the figure cache when the same combination of inputs was seen before, for the common
+    # combinations it was precomputed into the disk tier already (see precompute.py)
+    fig, radar_data = cached_leaderboard(figure_cache, table, selected_stat, selected_feature, age_range, positions,
+                                         order == 'asc')
+
+    # returning the options for the features as well (feature_options)
+    return fig, feature_options, radar_data
+
+
+# The leaderboard bar chart together with the radar values of its players, taken from the cache or built and stored in
+# it. The positions are sorted within the key, as their order does not change the chart. The precompute uses this
+# function as well, so it ends up with the same keys as the callback.
+def cached_leaderboard(cache, table, selected_stat, selected_feature, age_range, positions, ascending):
+    params = [selected_stat, selected_feature, age_range, sorted(positions or []), ascending, leaderboard_size]
+    fig = cache.cached_figure('explore-bar', table.version, params,
+                              lambda: build_top_players_chart(table, selected_feature, age_range, positions, ascending))
+
+    # the radar values of the players in the leaderboard, for the radar chart drawn in the browser when hovering
+    radar_data = cache.cached_figure(
+        'explore-radar-data', table.version, params,
+        lambda: build_radar_data(table, leaderboard_rows(table, selected_feature, age_range, positions, ascending)))
+    return fig, radar_data
+
+
+# The rows of the players in the leaderboard. The age and position filters are answered by the facet index of the
+# table, which combines the precomputed bitsets of the selected positions and ages. The ranking index then only keeps
+# the rows within that selection.
+def leaderboard_rows(table, selected_feature, age_range, positions, ascending):
+    facets = table.facets
+    selection = facets.mask(facets.select(positions=positions, age_range=age_range))
+    return table.ranking.top(selected_feature, leaderboard_size, where=selection, ascending=ascending)
+
+
+# builds the leaderboard bar chart of the explore tab
+def build_top_players_chart(table, selected_feature, age_range, positions, ascending):
+    df = table.frame
+
+    # Selecting the top (or bottom) players in the stat
+    rows = leaderboard_rows(table, selected_feature, age_range, positions, ascending)
+    top_players = df.iloc[rows][['player', selected_feature]]
+
+    # Generating some colors, one for each player in the leaderboard
+    bar_colors = figures.palette_colors(len(top_players))
+
+    # building the figure with the player_data in one go, including the title and the layout of the axes
+    # The customdata of every bar holds its player (read when the bar is clicked) and its position in the leaderboard
+    title = f'{"Bottom" if ascending else "Top"} {leaderboard_size} Players in {selected_feature}'
+    customdata = [[player, position] for position, player in enumerate(top_players['player'])]
+    return figures.bar_chart(top_players['player'], top_players[selected_feature], title, 'Player', selected_feature,
+                             customdata=customdata, marker_color=bar_colors)
@@ -1,10 +1,13 @@
 # Similar imports as in explore and compare
-from dash import callback, Input, Output, dcc, html, Dash, State
-import plotly.graph_objs as go
-import plotly.express as px
+import numpy as np
+from dash import callback, Input, Output, dcc, html, Dash, State, no_update, ctx
 
-from viz_app.main import dataframes, exclude_columns
-from viz_app.config import player_tables
+from viz_app.main import dataframes, figure_cache
+from viz_app import figures
+from viz_app.background import heavy_callback
+from viz_app.indexes import PlayerSelection, take_values
+from viz_app.config import player_tables, combined_table, similar_players_count, similar_players_metric, \
+    search_page_size, search_bins, search_distribution_rows, search_max_points
 
 # The html structure is almost identical to the explore tab, with 2 rows of input and 1 row of output
 layout = dcc.Tab(label='Find Players', children=[
@@ -13,7 +16,7 @@ layout = dcc.Tab(label='Find Players', children=[
             html.Label('Select Stat Category'),
             dcc.Dropdown(
                 id='stats-dropdown',
-                options=[{'label': stat, 'value': stat} for stat in player_tables],
+                options=[{'label': stat, 'value': stat} for stat in player_tables + [combined_table] if stat],
                 style={'width': '100%'}
             ),
         ], className='six columns'),
@@ -49,8 +52,43 @@ layout = dcc.Tab(label='Find Players', children=[
         ], className='six columns'),
     ], className='row', style={'marginBottom': '10px'}),
 
+    # The similarity search: adds the players most like the selected players (over the selected features) to the
+    # selection, the players it found are listed next to it together with their score
     html.Div([
         html.Div([
+            html.Label('Find Similar Players'),
+            dcc.RadioItems(
+                id='similar-metric',
+                options=[{'label': 'Cosine', 'value': 'cosine'}, {'label': 'Euclidean', 'value': 'euclidean'}],
+                value=similar_players_metric,
+                inline=True
+            ),
+            dcc.Input(id='similar-count', type='number', min=1, max=50, step=1, value=similar_players_count),
+            html.Button('Add similar players', id='similar-button', n_clicks=0),
+        ], className='six columns'),
+
+        html.Div([
+            html.Ul(id='similar-results', children=[]),
+        ], className='six columns'),
+    ], className='row', style={'marginBottom': '10px'}),
+
+    html.Div([
+        # The bar chart shows a page of players sorted on a feature, or the distribution of the features when there
+        # are too many players to show (auto). The buttons page through the players.
+        html.Div([
+            dcc.RadioItems(
+                id='bar-mode',
+                options=[{'label': 'Auto', 'value': 'auto'}, {'label': 'Players', 'value': 'page'},
+                         {'label': 'Distribution', 'value': 'distribution'}],
+                value='auto',
+                inline=True
+            ),
+            dcc.Dropdown(id='bar-sort-dropdown', placeholder='Sort players by', style={'width': '100%'}),
+            html.Button('Previous', id='bar-previous', n_clicks=0),
+            html.Span(id='bar-page-label', style={'margin': '0 10px'}),
+            html.Button('Next', id='bar-next', n_clicks=0),
+            dcc.Store(id='bar-page', data=0),
+            html.Div(id='search-status', style={'min-height': '20px'}),
             dcc.Graph(id='bar-chart'),
         ], className='six columns'),
 
@@ -70,11 +108,13 @@ def update_feature_and_team_dropdown(selected_stat):
     if selected_stat is None:
         return [], []
 
-    df = dataframes[selected_stat].copy()
+    table = dataframes.table(selected_stat)
+    df = table.frame
     teams = df['team'].unique()
-    team_options = [{'label': team, 'value': team} for team in teams]
-    numerics = ['int16', 'int32', 'int64', 'float16', 'float32', 'float64']
-    features = df.select_dtypes(include=numerics).columns.difference(['player', 'team']).difference(exclude_columns)
+    # the team options show the number of players of every team, taken from the facet index
+    counts = table.facets.counts('team')
+    team_options = [{'label': f'{team} ({counts.get(team, 0)})', 'value': team} for team in teams]
+    features = table.schema.numeric_features
     feature_options = [{'label': feature, 'value': feature} for feature in features]
 
     return feature_options, team_options
@@ -89,79 +129,238 @@ def update_player_dropdown(selected_teams, selected_stat):
     if selected_teams is None or not selected_teams or selected_stat is None:
         return []
 
-    df = dataframes[selected_stat].copy()
-    players = df[df['team'].isin(selected_teams)]['player'].unique()
+    # the rows of the selected teams come from the team bitsets of the facet index
+    table = dataframes.table(selected_stat)
+    rows = table.facets.positions(table.facets.select(teams=selected_teams))
+    players = table.frame['player'].iloc[rows].unique()
     return [{'label': player, 'value': player} for player in players]
 
 
-# Here we update the bar chart based on the input menus
+# The features the bar chart can be sorted on are the features it shows, sorted on the first one by default
 @callback(
-    Output('bar-chart', 'figure'),
+    Output('bar-sort-dropdown', 'options'),
+    Output('bar-sort-dropdown', 'value'),
     Input('stats-dropdown', 'value'),
     Input('feature-dropdown', 'value'),
-    Input('player-dropdown', 'value'))
-def update_bar_chart(selected_stat, selected_features, selected_players):
-    # some checks for valid data
+    State('bar-sort-dropdown', 'value'))
+def update_bar_sort_dropdown(selected_stat, selected_features, sort_feature):
     if selected_stat is None:
-        return go.Figure()
+        return [], None
 
-    bar_data = dataframes[selected_stat].copy()
+    features = bar_features(dataframes.table(selected_stat), selected_features)
+    options = [{'label': feature, 'value': feature} for feature in features]
+    return options, sort_feature if sort_feature in features else (features[0] if features else None)
 
-    if selected_players is None or len(selected_players) < 1:
-        selected_players = list(bar_data['player'])
 
-    bar_data = bar_data[bar_data['player'].isin(selected_players)]
+# The page of the bar chart: the buttons move a page back or forward, any other change starts at the first page again
+@callback(
+    Output('bar-page', 'data'),
+    Output('bar-page-label', 'children'),
+    Input('bar-previous', 'n_clicks'),
+    Input('bar-next', 'n_clicks'),
+    Input('stats-dropdown', 'value'),
+    Input('feature-dropdown', 'value'),
+    Input('player-dropdown', 'value'),
+    Input('bar-mode', 'value'),
+    Input('bar-sort-dropdown', 'value'),
+    State('bar-page', 'data'))
+def update_bar_page(previous_clicks, next_clicks, selected_stat, selected_features, selected_players, mode,
+                    sort_feature, page):
+    if selected_stat is None:
+        return 0, ''
 
-    if selected_features is None or len(selected_features) < 1:
-        numerics = ['int16', 'int32', 'int64', 'float16', 'float32', 'float64']
-        selected_features = bar_data.select_dtypes(include=numerics).columns.difference(['player', 'team']).difference(exclude_columns)
+    table = dataframes.table(selected_stat)
+    features = bar_features(table, selected_features)
+    if bar_mode(table, selected_players, mode) == 'distribution':
+        return 0, ''
 
-    # Bar colors based on amount of data
-    bar_colors = px.colors.qualitative.Plotly[:bar_data.shape[1]]
+    rows = len(bar_rows(table, selected_players or None, sort_feature))
+    pages = max(1, -(-rows // page_size(features)))
+    page = page or 0
+    if ctx.triggered_id == 'bar-previous':
+        page = max(0, page - 1)
+    elif ctx.triggered_id == 'bar-next':
+        page = min(pages - 1, page + 1)
+    else:
+        page = 0
+    return page, f'Page {page + 1} of {pages} ({rows} players)'
 
-    # simply returning the data
-    return px.bar(bar_data, x='player', y=selected_features, custom_data=['player'], barmode='group', title='Selected Features for Players',
-                  color_discrete_sequence=bar_colors)
 
-# The radar chart updates based on selected players
+# Here we update the bar chart and the radar chart based on the input menus. Both charts react to the same inputs and
+# show the same players, so they are built by one callback (the radar chart only when it is not in the figure cache).
+# The bar chart is bounded by search_max_points bars however large the table is: it shows one page of the players
+# sorted on a feature, or the distribution of the features when no players are selected in a large table. It runs in
+# the background when available (see background.py), a newer change cancels the call that is still running.
 @callback(
+    Output('bar-chart', 'figure'),
     Output('radar-chart', 'figure'),
     Input('stats-dropdown', 'value'),
     Input('feature-dropdown', 'value'),
-    Input('player-dropdown', 'value'))
-def update_radar_chart(selected_stat, selected_features, selected_players):
-    # check for valid data
-    if selected_stat is None or selected_features is None or not selected_features or selected_players is None or not selected_players:
-        return go.Figure()
-
-    df = dataframes[selected_stat].copy()
-    radar_data = []
-
-    # for every player, add their data
-    for player in selected_players:
-        player_data = df[df['player'] == player].iloc[0]
-        radar_data.append(
-            go.Scatterpolar(
-                r=player_data[selected_features],
-                theta=selected_features,
-                fill='toself',
-                name=player
-            )
-        )
-    # update radar chart title and range using the max().max() trick as discussed in the explore,py
-    layout = go.Layout(
-        title=f'Radar chart of selected players',
-        polar=dict(radialaxis=dict(visible=True, range=[0, max(df[selected_features].max().max(), 1)])),
-        showlegend=True
-    )
-
-    # returning the figure with the updated layout
-    return go.Figure(data=radar_data, layout=layout).update_layout(legend=dict(font=dict(family='Arial')), polar=dict(
-        radialaxis=dict(linecolor='darkgray', gridcolor='lightgray', linewidth=1, showticklabels=False, ticks=''),
-        angularaxis=dict(linecolor='darkgray', gridcolor='lightgray', linewidth=1, showticklabels=True, ticks='')))
-
-
-# clicking within the bar graph allows for player selection using this callback
+    Input('player-dropdown', 'value'),
+    Input('bar-mode', 'value'),
+    Input('bar-sort-dropdown', 'value'),
+    Input('bar-page', 'data'),
+    **heavy_callback(running=[(Output('search-status', 'children'), 'Updating the charts...', '')],
+                     cancel=[Input('tabs-select', 'value')]))
+def update_search_charts(selected_stat, selected_features, selected_players, mode='auto', sort_feature=None, page=0):
+    # some checks for valid data
+    if selected_stat is None:
+        return figures.empty_figure(), figures.empty_figure()
+
+    table = dataframes.table(selected_stat)
+
+    # the bar chart shows every player when none are selected, and every numeric feature when no features are selected
+    features = bar_features(table, selected_features)
+    players = selected_players if selected_players else None
+    mode = bar_mode(table, selected_players, mode)
+    if sort_feature not in features:
+        sort_feature = features[0] if features else None
+
+    # the charts are taken from the figure cache when they were built before. The players are sorted on the feature
+    # within the bar chart, so their order does not matter for its key
+    params = [selected_stat, features, sorted(selected_players or []), mode, sort_feature, page or 0]
+    bar_chart = figure_cache.cached_figure(
+        'search-bar', table.version, params,
+        lambda: (build_distribution_chart(table, features, players) if mode == 'distribution' else
+                 build_bar_chart(table, features, players, sort_feature, page or 0)))
+
+    # the radar chart needs both features and players
+    if not selected_features or not selected_players:
+        return bar_chart, figures.empty_figure()
+
+    params = [selected_stat, selected_features, selected_players]
+    radar_chart = figure_cache.cached_figure(
+        'search-radar', table.version, params,
+        lambda: build_radar_chart(table, selected_features, PlayerSelection(table, selected_players)))
+    return bar_chart, radar_chart
+
+
+# the features of the bar chart, the selected ones or every numeric feature, as many as fit search_max_points
+def bar_features(table, selected_features):
+    features = selected_features if selected_features else table.schema.numeric_features
+    return list(features)[:search_max_points]
+
+
+# auto shows the distribution when no players are selected and the table is too large to page through
+def bar_mode(table, selected_players, mode):
+    if mode in ('page', 'distribution'):
+        return mode
+    return 'distribution' if not selected_players and len(table.frame) > search_distribution_rows else 'page'
+
+
+# the number of players on a page, as many as fit search_max_points bars with all features
+def page_size(features):
+    return max(1, min(search_page_size, search_max_points // max(1, len(features))))
+
+
+# The row positions of the players the bar chart pages through, sorted on the feature (highest first). All players
+# come in the order of the ranking index (players without a value for the feature are left out), selected players
+# are sorted among themselves (players without a value come last).
+def bar_rows(table, players, sort_feature):
+    if players is None:
+        if sort_feature in table.ranking:
+            return table.ranking.order(sort_feature)
+        return np.arange(len(table.frame))
+
+    rows = table.players.rows(players)
+    if sort_feature is None:
+        return rows
+    values = take_values(table.frame, rows, [sort_feature])[:, 0]
+    return rows[np.argsort(-values, kind='stable')]
+
+
+def build_bar_chart(table, features, players, sort_feature, page):
+    size = page_size(features)
+    rows = bar_rows(table, players, sort_feature)[page * size:(page + 1) * size]
+
+    # Bar colors based on amount of data
+    bar_colors = figures.PALETTE[:table.frame.shape[1]]
+
+    # simply returning the data of the page
+    values = take_values(table.frame, rows, features)
+    title = 'Selected Features for Players'
+    if sort_feature is not None:
+        title += f' by {sort_feature}'
+    return figures.feature_bar_chart(table.frame['player'].to_numpy()[rows], features, values.T, title, bar_colors)
+
+
+# The distribution of every feature over the players (all players when players is None): the number of players within
+# each of search_bins equal parts of the range of the feature
+def build_distribution_chart(table, features, players):
+    bins = max(1, min(search_bins, search_max_points // max(1, len(features))))
+    rows = np.arange(len(table.frame)) if players is None else table.players.rows(players)
+    values = take_values(table.frame, rows, features)
+
+    counts = []
+    ranges = []
+    for i, feature in enumerate(features):
+        column = values[:, i][~np.isnan(values[:, i])]
+        low, high = (column.min(), column.max()) if len(column) else (0.0, 0.0)
+        feature_counts, edges = np.histogram(column, bins=bins, range=(low, high if high > low else low + 1))
+        counts.append(feature_counts)
+        ranges.append(np.column_stack([edges[:-1], edges[1:]]))
+
+    labels = [f'{100 * i // bins}-{100 * (i + 1) // bins}%' for i in range(bins)]
+    bar_colors = figures.PALETTE[:table.frame.shape[1]]
+    title = f'Distribution of the features over {len(rows)} players'
+    return figures.distribution_chart(features, labels, counts, ranges, title, bar_colors)
+
+
+def build_radar_chart(table, selected_features, selection):
+    # the first row of every selected player, gathered as one array. Every feature is scaled by its own maximum as
+    # discussed in the explore.py (all players at once), the real values are shown when hovering.
+    values = selection.first_values(selected_features)
+    scaled = table.stats.max_scale(values, selected_features)
+    radar_data = figures.radar_traces(selection.players, scaled, selected_features, values)
+
+    # returning the radar chart with its title, the range is 0-1 as the features are scaled
+    return figures.radar_chart(radar_data, 'Radar chart of selected players', [0, 1])
+
+
+# Adds the players most like the players selected in the player dropdown to that dropdown and to the page wide
+# selection. The similarity is computed over the selected features (all numeric features when none are selected), with
+# the standardized feature matrix of the table (see similarity.py).
+@callback(
+    Output('player-dropdown', 'value', allow_duplicate=True),
+    Output('player-dropdown', 'options', allow_duplicate=True),
+    Output('selected-players', 'value', allow_duplicate=True),
+    Output('similar-results', 'children'),
+    Input('similar-button', 'n_clicks'),
+    State('stats-dropdown', 'value'),
+    State('feature-dropdown', 'value'),
+    State('player-dropdown', 'value'),
+    State('player-dropdown', 'options'),
+    State('similar-count', 'value'),
+    State('similar-metric', 'value'),
+    State('selected-players', 'value'),
+    prevent_initial_call=True
+)
+def add_similar_players(n_clicks, selected_stat, selected_features, selected_players, options, count, metric,
+                        players):
+    if selected_stat is None or not selected_players:
+        return no_update, no_update, no_update, [html.Li('Select players to find players like them')]
+
+    table = dataframes.table(selected_stat)
+    neighbours = table.similarity.neighbours(selected_players, selected_features, int(count or similar_players_count),
+                                             metric or similar_players_metric)
+    found = [player for similar in neighbours.values() for player, _ in similar]
+    if not found:
+        return no_update, no_update, no_update, [html.Li('No similar players found')]
+
+    # every selected player with the players found for it and their score (similarity or distance)
+    results = [html.Li('{}: {}'.format(player, ', '.join(f'{name} ({score:.2f})' for name, score in similar)))
+               for player, similar in neighbours.items()]
+
+    values = list(dict.fromkeys([*selected_players, *found]))
+    options = options or []
+    known = {option['value'] for option in options}
+    options = options + [{'label': player, 'value': player} for player in dict.fromkeys(found) if player not in known]
+    return values, options, list(dict.fromkeys([*(players or []), *found])), results
+
+
+# clicking within the bar graph allows for player selection using this callback. The bars of the page mode hold their
+# player in the customdata (like the leaderboard of the explore tab), the bins of the distribution mode hold the range
+# of the bin instead and are no players, so a click on those leaves the selection as it is.
 @callback(
     Output('selected-players', 'value', allow_duplicate=True),
     Input('bar-chart', 'clickData'),
@@ -175,8 +374,10 @@ def add_to_selection(clickData, players):
     if clickData is None:
         return players
 
-
-    player = clickData['points'][0]['label']
+    customdata = clickData['points'][0].get('customdata')
+    if not customdata or not isinstance(customdata[0], str):
+        return players
+    player = customdata[0]
     if player not in players:
         players.append(player)
     return players
\ No newline at end of file